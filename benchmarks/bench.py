@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+# Benchmarks the settings tree, the setting backends and tweakd against a synthetic tree of setting
+# definitions and a fake system tree with sysfs, /proc, /boot/osk.conf and a home directory. This
+# makes it possible to measure the cost of the different phases without running on a phone.
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+
+BACKENDS = ['gtk3settings', 'environment', 'sysfs', 'osksdl', 'css', 'symlink', 'soundtheme', 'hardwareinfo',
+            'gsettings']
+HARDWAREINFO_KEYS = ['model', 'memory', 'cpu', 'chipset', 'kernel', 'distro', 'disk', 'architecture']
+GSETTINGS_KEYS = [
+    ('org.gnome.desktop.interface.clock-show-date', 'boolean'),
+    ('org.gnome.desktop.interface.clock-show-seconds', 'boolean'),
+    ('org.gnome.desktop.interface.enable-animations', 'boolean'),
+    ('org.gnome.desktop.interface.text-scaling-factor', 'double'),
+]
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as handle:
+        handle.write(data)
+
+
+def have_gsettings():
+    try:
+        import gi
+        from gi.repository import Gio
+    except ImportError:
+        return False
+    return Gio.SettingsSchemaSource.get_default().lookup('org.gnome.desktop.interface', True) is not None
+
+
+def make_definition(backend, i, sysroot):
+    name = f'{backend} {i}'
+    if backend == 'gtk3settings':
+        return {'name': name, 'type': 'boolean', 'backend': backend, 'key': f'gtk-bench-{i}', 'default': '0',
+                'map': {True: '1', False: '0'}}
+    if backend == 'environment':
+        return {'name': name, 'type': 'choice', 'backend': backend, 'key': f'BENCH_{i}', 'map': {'A': 'a', 'B': 'b'}}
+    if backend == 'sysfs':
+        return {'name': name, 'type': 'number', 'backend': backend, 'stype': 'int', 'min': 0, 'max': 10000,
+                'step': 1, 'key': os.path.join(sysroot, f'sys/class/bench/attr{i}')}
+    if backend == 'osksdl':
+        return {'name': name, 'type': 'color', 'backend': backend, 'key': f'bench-color-{i}', 'default': '#000000'}
+    if backend == 'css':
+        return {'name': name, 'type': 'file', 'backend': backend, 'key': '~/.config/gtk-3.0/gtk.css',
+                'selector': f'.bench-{i}', 'guard': f'bench-{i}', 'css': {'background-image': '%'}}
+    if backend == 'symlink':
+        return {'name': name, 'type': 'file', 'backend': backend, 'key': f'~/.local/share/bench/link{i}',
+                'source_ext': True}
+    if backend == 'soundtheme':
+        return {'name': name, 'type': 'file', 'backend': backend, 'key': f'~/.local/share/sounds/__custom/sound{i}'}
+    if backend == 'hardwareinfo':
+        return {'name': name, 'type': 'info', 'backend': backend, 'key': HARDWAREINFO_KEYS[i % len(HARDWAREINFO_KEYS)]}
+    if backend == 'gsettings':
+        key, gtype = GSETTINGS_KEYS[i % len(GSETTINGS_KEYS)]
+        return {'name': name, 'type': 'boolean' if gtype == 'boolean' else 'number', 'gtype': gtype, 'key': key,
+                'min': 0.5, 'max': 3, 'step': 0.1}
+
+
+def make_sysroot(sysroot, size, backends):
+    """ Create the fake system tree and the definition files for size settings """
+    import yaml
+
+    home = os.path.join(sysroot, 'home')
+    write(os.path.join(sysroot, 'proc/cpuinfo'), ''.join(
+        f'processor\t: {i}\nCPU implementer\t: 0x41\nCPU architecture: 8\nCPU variant\t: 0x0\n'
+        f'CPU part\t: 0xd03\nCPU revision\t: 4\n\n' for i in range(4)))
+    write(os.path.join(sysroot, 'proc/meminfo'), 'MemTotal:        2009548 kB\nMemFree:          100000 kB\n')
+    write(os.path.join(sysroot, 'proc/sys/kernel/random/boot_id'), 'bench-boot\n')
+    write(os.path.join(sysroot, 'proc/device-tree/model'), 'Pine64 PinePhone (1.2)')
+    write(os.path.join(sysroot, 'proc/device-tree/compatible'), 'pine64,pinephone\0allwinner,sun50i-a64\0')
+    write(os.path.join(sysroot, 'etc/os-release'), 'NAME="Bench"\nPRETTY_NAME="Bench Linux"\n')
+    write(os.path.join(sysroot, 'boot/osk.conf'), '# osk-sdl\nkeyboard-background = #0e0e12\n')
+    write(os.path.join(home, '.config/gtk-3.0/settings.ini'), '[Settings]\ngtk-theme-name = Adwaita\n')
+    write(os.path.join(home, '.config/gtk-3.0/gtk.css'), 'window { color: red; }\n')
+    os.makedirs(os.path.join(home, '.local/share/bench'), exist_ok=True)
+    write(os.path.join(sysroot, 'media/sound.oga'), '')
+    write(os.path.join(sysroot, 'media/background.png'), '')
+    for i in range(20):
+        write(os.path.join(sysroot, f'usr/share/themes/Theme{i}/gtk-3.0/gtk.css'), '')
+        write(os.path.join(sysroot, f'usr/share/themes/Theme{i}/index.theme'),
+              f'[Desktop Entry]\nName=Theme {i}\n[X-GNOME-Metatheme]\nname=Theme {i}\n')
+        write(os.path.join(sysroot, f'usr/share/icons/Icons{i}/index.theme'),
+              f'[Icon Theme]\nName=Icons {i}\n' + ''.join(f'\n[{s}x{s}/apps]\nSize={s}\n' for s in range(1, 500)))
+        write(os.path.join(sysroot, f'usr/share/sounds/Sounds{i}/index.theme'), f'[Sound Theme]\nName=Sounds {i}\n')
+
+    settings = {backend: [] for backend in backends}
+    for i in range(size):
+        backend = backends[i % len(backends)]
+        if backend == 'sysfs':
+            write(os.path.join(sysroot, f'sys/class/bench/attr{i}'), '1000\n')
+        settings[backend].append(make_definition(backend, i, sysroot))
+
+    # One definition file per backend with pages of 5 sections of 10 settings
+    datadir = os.path.join(sysroot, 'usr/share/danctnix-tweaks')
+    os.makedirs(datadir, exist_ok=True)
+    for backend in backends:
+        pages = []
+        for p, start in enumerate(range(0, len(settings[backend]), 50)):
+            sections = []
+            for s, offset in enumerate(range(start, min(start + 50, len(settings[backend])), 10)):
+                sections.append({'name': f'Section {s}', 'weight': s, 'settings': settings[backend][offset:offset + 10]})
+            pages.append({'name': f'{backend} {p}', 'weight': p, 'sections': sections})
+        with open(os.path.join(datadir, f'{backend}.yml'), 'w') as handle:
+            yaml.dump(pages, handle)
+    return datadir
+
+
+def setup_environment(sysroot):
+    from danctnix_tweaks import hardwareinfo, oskconf, themes
+
+    os.environ['HOME'] = os.path.join(sysroot, 'home')
+    os.environ['XDG_CONFIG_HOME'] = os.path.join(sysroot, 'home/.config')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(sysroot, 'cache')
+    hardwareinfo.SYSROOT = sysroot
+    oskconf.OSK_CONF = os.path.join(sysroot, 'boot/osk.conf')
+    themes.ROOTS = {
+        'gtk3themes': [os.path.join(sysroot, 'usr/share/themes'), '~/.local/share/themes'],
+        'iconthemes': [os.path.join(sysroot, 'usr/share/icons'), '~/.local/share/icons'],
+        'soundthemes': [os.path.join(sysroot, 'usr/share/sounds'), '~/.local/share/sounds'],
+    }
+
+
+def reset_state():
+    """ Drop all in-process caches so the next phase starts like a fresh process """
+    from danctnix_tweaks import documents, hardwareinfo, themes
+
+    documents.flush()
+    documents._documents.clear()
+    themes._catalogs.clear()
+    hardwareinfo._values = None
+    if 'danctnix_tweaks.gsettings' in sys.modules:
+        sys.modules['danctnix_tweaks.gsettings']._schemas.clear()
+    if 'danctnix_tweaks.backends.symlink' in sys.modules:
+        sys.modules['danctnix_tweaks.backends.symlink']._indexes.clear()
+
+
+def new_value(setting, sysroot):
+    if setting.type == 'boolean':
+        return True
+    if setting.type == 'choice':
+        return list(setting.map)[-1]
+    if setting.type == 'number':
+        return 2000 if setting.backend == 'sysfs' else 1.5
+    if setting.type == 'color':
+        return '#ff0000'
+    if setting.type == 'file':
+        return os.path.join(sysroot, 'media/sound.oga' if setting.backend == 'symlink' else 'media/background.png')
+
+
+def run(size, backends, memory=False):
+    """ Run all phases once in a fresh fake sysroot, returns {phase: (seconds, peak bytes)} """
+    from danctnix_tweaks import documents, tweakd
+    from danctnix_tweaks.settingstree import SettingsTree
+
+    results = {}
+
+    def measure(name, func):
+        reset_peak = memory and tracemalloc.is_tracing()
+        if reset_peak:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - before if reset_peak else None
+        results[name] = (elapsed, peak)
+        return result
+
+    with tempfile.TemporaryDirectory(prefix='danctnix-tweaks-bench-') as sysroot:
+        datadir = make_sysroot(sysroot, size, backends)
+        setup_environment(sysroot)
+        reset_state()
+
+        def load():
+            tree = SettingsTree()
+            tree.load_dir(datadir)
+            # Sorting and indexing happen on first use
+            tree.find()
+            return tree
+
+        measure('load_dir (cold)', load)
+        reset_state()
+        tree = measure('load_dir (warm)', load)
+
+        by_backend = {}
+        for path, setting in tree.iter_settings():
+            by_backend.setdefault(setting.definition.get('backend', 'gsettings'), []).append(setting)
+
+        for backend in backends:
+            settings = by_backend.get(backend, [])
+            measure(f'get_value {backend}', lambda: [s.get_value() for s in settings])
+
+        measure('get_values (all)', lambda: tree.get_values())
+
+        for backend in backends:
+            settings = [s for s in by_backend.get(backend, []) if s.type != 'info']
+            if not settings:
+                continue
+
+            def set_values():
+                with documents.batch():
+                    for setting in settings:
+                        setting.set_value(new_value(setting, sysroot))
+
+            measure(f'set_value {backend}', set_values)
+
+        config = os.path.join(sysroot, 'etc/tweakd.conf')
+
+        def save():
+            with open(config, 'w') as handle:
+                tree.save_tweakd_config(handle)
+
+        measure('save_tweakd_config', save)
+
+        argv = sys.argv
+        sys.argv = ['danctnix-tweakd', '--config', config]
+        try:
+            reset_state()
+            measure('tweakd.main (changed)', lambda: tweakd.main(None, datadir=os.path.dirname(datadir)))
+            reset_state()
+            measure('tweakd.main (unchanged)', lambda: tweakd.main(None, datadir=os.path.dirname(datadir)))
+        finally:
+            sys.argv = argv
+        reset_state()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark danctnix-tweaks against a synthetic settings tree")
+    parser.add_argument('--size', type=int, nargs='+', default=[200, 1000], help="Number of settings to generate")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per size, the fastest run is reported")
+    parser.add_argument('--backend', action='append', choices=BACKENDS, help="Only benchmark these backends")
+    parser.add_argument('--baseline', default=os.path.join(os.path.dirname(__file__), 'baseline.json'),
+                        help="File to compare the results against")
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown compared to the baseline")
+    args = parser.parse_args()
+
+    backends = args.backend or BACKENDS
+    if 'gsettings' in backends:
+        # Never touch the real dconf database of the user running the benchmark
+        os.environ['GSETTINGS_BACKEND'] = 'memory'
+        if not have_gsettings():
+            print("Skipping the gsettings backend, gi or the gnome schemas are not available")
+            backends = [backend for backend in backends if backend != 'gsettings']
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    report = {}
+    regressions = 0
+    for size in args.size:
+        times = {}
+        for i in range(args.repeat):
+            for phase, (elapsed, peak) in run(size, backends).items():
+                times[phase] = min(times.get(phase, elapsed), elapsed)
+
+        # Separate run for the memory usage since tracing allocations slows everything down
+        tracemalloc.start()
+        peaks = {phase: peak for phase, (elapsed, peak) in run(size, backends, memory=True).items()}
+        tracemalloc.stop()
+
+        print(f"\n{size} settings")
+        print(f"{'phase':<32} {'time':>10} {'peak mem':>12}  baseline")
+        report[str(size)] = {}
+        for phase in times:
+            ms = times[phase] * 1000
+            kib = peaks[phase] / 1024
+            report[str(size)][phase] = {'time': ms, 'peak': kib}
+
+            compare = ''
+            old = baseline.get(str(size), {}).get(phase)
+            if old is not None:
+                compare = f"{(ms - old['time']) / old['time'] * 100 if old['time'] else 0:+.0f}%"
+                if ms > old['time'] * (1 + args.tolerance) and ms - old['time'] > 1:
+                    compare += ' SLOWER'
+                    regressions += 1
+                if kib > old['peak'] * (1 + args.tolerance) and kib - old['peak'] > 64:
+                    compare += ' MORE MEMORY'
+                    regressions += 1
+            print(f"{phase:<32} {ms:>7.1f} ms {kib:>8.0f} KiB  {compare}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nStored baseline in {args.baseline}")
+    elif regressions:
+        print(f"\n{regressions} regressions compared to {args.baseline}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
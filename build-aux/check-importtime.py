@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Checks the imports of the daemon, CLI and GUI startup paths with python -X importtime so modules
+# that are only needed for some features don't creep back into the startup path
+
+import os
+import sys
+import argparse
+import subprocess
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+settings = os.path.join(root, 'settings')
+
+PROFILES = {
+    'tweakd': {
+        'code': 'import danctnix_tweaks.tweakd as t; st = t.SettingsTree(daemon=True); st.load_dir({!r})'.format(settings),
+        'forbidden': [
+            'gi',
+            'yaml',
+            'danctnix_tweaks.cpus',
+            'danctnix_tweaks.socs',
+            'danctnix_tweaks.hardwareinfo',
+            'danctnix_tweaks.themes',
+            'danctnix_tweaks.server',
+            'subprocess',
+            'socketserver',
+            'json',
+        ],
+    },
+    'cli': {
+        'code': 'import danctnix_tweaks.cli as c; st = c.SettingsTree(staged=True); st.load_dir({!r})'.format(settings),
+        'needs': 'gi',
+        'forbidden': [
+            'gi.repository.Gtk',
+            'gi.repository.Handy',
+            'yaml',
+            'danctnix_tweaks.window',
+            'danctnix_tweaks.loader',
+            'danctnix_tweaks.server',
+            'concurrent.futures',
+            'subprocess',
+            'socketserver',
+        ],
+    },
+    'gui': {
+        'code': 'import danctnix_tweaks.window',
+        'needs': 'gi',
+        'forbidden': [
+            'yaml',
+            'danctnix_tweaks.cpus',
+            'danctnix_tweaks.socs',
+            'danctnix_tweaks.hardwareinfo',
+            'danctnix_tweaks.themes',
+            'danctnix_tweaks.server',
+            'concurrent.futures',
+            'subprocess',
+            'socketserver',
+        ],
+    },
+}
+
+
+def importtime(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    modules = {}
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[12:].split('|')
+        modules[name.strip()] = int(self_us)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the startup imports of danctnix-tweaks")
+    parser.add_argument('profile', nargs='*', help="Profiles to check: " + ', '.join(PROFILES))
+    parser.add_argument('--budget', type=float, help="Fail if the imports of a profile take longer than this (ms)")
+    args = parser.parse_args()
+
+    baseline = importtime('pass')
+    failed = False
+    checked = 0
+    for name in args.profile or PROFILES:
+        if name not in PROFILES:
+            parser.error(f"unknown profile {name}")
+        profile = PROFILES[name]
+        if 'needs' in profile:
+            try:
+                importtime(f'import {profile["needs"]}')
+            except subprocess.CalledProcessError:
+                print(f"{name}: skipped, {profile['needs']} is not available")
+                continue
+
+        # The first run fills the definition caches, the second one is the warm start
+        importtime(profile['code'])
+        modules = importtime(profile['code'])
+        added = {module: us for module, us in modules.items() if module not in baseline}
+        total = sum(added.values()) / 1000
+        print(f"{name}: {len(added)} modules imported in {total:.1f} ms")
+        checked += 1
+
+        for module in profile['forbidden']:
+            if module in added:
+                print(f"  {module} should not be imported")
+                failed = True
+        if args.budget is not None and total > args.budget:
+            print(f"  over the budget of {args.budget:.1f} ms")
+            failed = True
+
+    if failed:
+        return 1
+    if checked == 0:
+        # Tells meson the test was skipped
+        return 77
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
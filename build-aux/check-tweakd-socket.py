@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Runs the resident tweakd socket server on a temporary socket and checks the apply and metrics
+# requests, that a client that connects without sending anything doesn't block the others and that
+# the request size and the number of handler threads are limited
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+
+from danctnix_tweaks import ipc, server  # noqa: E402
+
+
+def check(condition, message):
+    if not condition:
+        print(f"FAIL: {message}")
+        sys.exit(1)
+    print(f"ok: {message}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tweakd.sock')
+        config_path = os.path.join(tmp, 'tweakd.conf')
+
+        # Stand-in for a sysfs attribute that is in the setting definitions
+        attribute = os.path.join(tmp, 'attribute')
+        with open(attribute, 'w') as handle:
+            handle.write('1\n')
+        missing = os.path.join(tmp, 'missing', 'attribute')
+        whitelist = {'sysfs': {attribute, missing}, 'osksdl': set()}
+
+        # Short enough to keep the check fast, long enough that the requests below have to be
+        # served while the idle client is still connected
+        server.RequestHandler.timeout = 3
+        with server.TweakdServer(path, whitelist, config_path) as tweakd:
+            thread = threading.Thread(target=tweakd.serve_forever, daemon=True)
+            thread.start()
+
+            response = ipc.request({'action': 'metrics'}, path=path, timeout=5)
+            check(response['status'] == 'ok' and 'metrics' in response, "metrics request")
+
+            # Keep a connection open without sending a request while the other clients are served
+            idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            idle.connect(path)
+
+            config = f'[sysfs]\n{attribute} = 2\n'
+            response = ipc.request({'action': 'apply', 'config': config}, path=path, timeout=1)
+            check(response['status'] == 'ok' and len(response['applied']) == 1, "apply while another client is idle")
+            with open(attribute) as handle:
+                check(handle.read().strip() == '2', "apply writes the attribute")
+            with open(config_path) as handle:
+                check(handle.read() == config, "apply stores tweakd.conf")
+
+            response = ipc.request({'action': 'apply', 'config': config}, path=path, timeout=5)
+            check(response['status'] == 'ok' and response['applied'] == [], "unchanged values are not written")
+
+            response = ipc.request({'action': 'apply', 'config': f'[sysfs]\n{tmp}/other = 1\n'}, path=path, timeout=5)
+            check(response['status'] == 'ok' and response['applied'] == [], "paths outside the whitelist are skipped")
+
+            config = f'[sysfs]\n{missing} = 1\n{attribute} = 3\n'
+            response = ipc.request({'action': 'apply', 'config': config}, path=path, timeout=5)
+            check(response['status'] == 'error' and missing in response['message'], "write errors are reported")
+            check(len(response['applied']) == 1, "a failed write doesn't stop the other values")
+
+            response = ipc.request({'action': 'unknown'}, path=path, timeout=5)
+            check(response['status'] == 'error', "unknown actions are rejected")
+
+            response = ipc.request({'action': 'metrics', 'padding': 'x' * server.MAX_REQUEST}, path=path, timeout=5)
+            check(response['status'] == 'error' and 'too long' in response['message'], "long requests are rejected")
+
+            # Clients over the limit wait for a free handler instead of getting their own thread
+            waiting = []
+            for i in range(server.MAX_CLIENTS):
+                client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                client.connect(path)
+                waiting.append(client)
+            time.sleep(0.2)
+            busy = threading.active_count()
+            late = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            late.connect(path)
+            late.sendall(b'{"action": "metrics"}\n')
+            late.settimeout(0.5)
+            try:
+                late.recv(4096)
+                served = True
+            except socket.timeout:
+                served = False
+            # The main thread, the server thread and one thread per handler
+            check(not served and busy == server.MAX_CLIENTS + 2 and threading.active_count() == busy,
+                  "handler threads are limited")
+            for client in waiting:
+                client.close()
+            late.settimeout(5)
+            check(b'"ok"' in late.recv(4096), "waiting client is served once a handler is free")
+            late.close()
+
+            # The idle client is disconnected once the handler timeout runs out
+            idle.settimeout(5)
+            check(idle.recv(4096) == b'', "idle client is disconnected")
+            idle.close()
+
+            tweakd.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
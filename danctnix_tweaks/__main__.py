@@ -1,30 +1,28 @@
+import logging
 import argparse
-import os
-import gi
-
-from danctnix_tweaks.window import TweaksWindow
-
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, Gio
-
-gi.require_version('Handy', '1')
-from gi.repository import Handy
-
-
-class TweaksApplication(Gtk.Application):
-    def __init__(self, application_id, flags, datadir):
-        self.datadir = datadir
-        Gtk.Application.__init__(self, application_id=application_id, flags=flags)
-        self.connect("activate", self.new_window)
-
-    def new_window(self, *args):
-        TweaksWindow(self, self.datadir)
 
 
 def main(version, datadir=None):
-    Handy.init()
-    app = TweaksApplication("org.danctnix.Tweaks", Gio.ApplicationFlags.FLAGS_NONE, datadir)
-    app.run()
+    parser = argparse.ArgumentParser(description="DanctNIX Tweaks")
+    parser.add_argument('--prefetch-hardware-info', action='store_true',
+                        help="Probe the hardware info for the About page and exit")
+    parser.add_argument('--staged', action='store_true',
+                        help="Collect changes and only save them when pressing Apply")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="Show informational messages, pass twice for debug messages")
+    args = parser.parse_args()
+
+    levels = [logging.WARNING, logging.INFO, logging.DEBUG]
+    logging.basicConfig(level=levels[min(args.verbose, 2)], format='%(levelname)s %(name)s: %(message)s')
+
+    if args.prefetch_hardware_info:
+        from danctnix_tweaks import hardwareinfo
+        hardwareinfo.prefetch()
+        return
+
+    # Gtk is only loaded when the window is going to be shown
+    from danctnix_tweaks import window
+    window.run(datadir, staged=args.staged)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,43 @@
+import importlib
+
+# The module for every built-in backend, it's only imported when the first setting using that
+# backend is created
+BUILTIN = {
+    'gsettings': 'danctnix_tweaks.backends.gsettings',
+    'gtk3settings': 'danctnix_tweaks.backends.gtk3settings',
+    'environment': 'danctnix_tweaks.backends.environment',
+    'sysfs': 'danctnix_tweaks.backends.sysfs',
+    'osksdl': 'danctnix_tweaks.backends.osksdl',
+    'hardwareinfo': 'danctnix_tweaks.backends.hardwareinfo',
+    'css': 'danctnix_tweaks.backends.css',
+    'symlink': 'danctnix_tweaks.backends.symlink',
+    'soundtheme': 'danctnix_tweaks.backends.symlink',
+}
+
+_registry = {}
+
+
+def register(name):
+    """ Class decorator that makes a Setting subclass available as the backend called name
+
+    Other packages can use this to add backends, the module has to be imported before the
+    setting definitions are loaded.
+    """
+    def decorator(cls):
+        _registry[name] = cls
+        return cls
+    return decorator
+
+
+def get_backend(name):
+    if name not in _registry and name in BUILTIN:
+        importlib.import_module(BUILTIN[name])
+    if name not in _registry:
+        raise ValueError(f"Unknown backend {name}")
+    return _registry[name]
+
+
+def create_setting(definition, daemon=False):
+    """ Create the Setting object for a setting definition """
+    cls = get_backend(definition['backend'] if 'backend' in definition else 'gsettings')
+    return cls(definition, daemon=daemon)
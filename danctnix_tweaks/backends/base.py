@@ -0,0 +1,170 @@
+import logging
+
+from danctnix_tweaks import metrics
+from danctnix_tweaks.tracing import span
+
+log = logging.getLogger(__name__)
+
+TRUE = ['true', 'yes', 'on', '1']
+FALSE = ['false', 'no', 'off', '0']
+
+
+def parse_value(setting, raw):
+    """ Convert a value from the command line to the type of the setting """
+    if setting.type == 'boolean':
+        if raw.lower() in TRUE:
+            return True
+        if raw.lower() in FALSE:
+            return False
+        raise ValueError(f"expected true or false, got {raw}")
+    if setting.type == 'number':
+        try:
+            return int(raw)
+        except ValueError:
+            return float(raw)
+    if setting.type == 'file' and raw == '':
+        return None
+    return raw
+
+
+def check_value(setting, value):
+    """ Check the type of a value from a JSON file or profile, strings are converted like command line values """
+    if isinstance(value, str):
+        return parse_value(setting, value)
+    if setting.type == 'boolean':
+        valid = isinstance(value, bool)
+    elif setting.type == 'number':
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    else:
+        valid = value is None and setting.type == 'file'
+    if not valid:
+        import json
+
+        raise ValueError(f"expected a {setting.type} value, got {json.dumps(value)}")
+    return value
+
+
+# Needed for qt5 theming, disabled because qt5 theming is a mess
+# from PyQt5 import QtWidgets
+
+class Setting:
+    """ Base class for the settings of all backends
+
+    The subclasses implement setup() to parse the backend specific part of the definition and
+    read() and write() to access the raw value, the mapping of values is done here.
+    """
+
+    __slots__ = ['daemon', 'name', 'weight', 'type', 'help', 'definition', 'callback', 'widget',
+                 'valid', 'value', 'page', 'section', 'key', 'document', 'map', 'data']
+
+    # The name of the backend as used in the tweakd config and the metrics
+    backend = None
+
+    # Settings that are applied by tweakd as root
+    needs_root = False
+
+    def __init__(self, definition, daemon=False):
+        self.daemon = daemon
+        self.name = definition['name']
+        self.weight = 50
+        if 'weight' in definition:
+            self.weight = definition['weight']
+        self.type = definition['type']
+        self.help = definition['help'] if 'help' in definition else None
+
+        self.definition = definition
+        self.callback = None
+        self.widget = None
+        self.valid = True
+        self.value = None
+        self.page = None
+        self.section = None
+        self.key = None
+        self.document = None
+
+        self.map = definition['map'] if 'map' in definition else None
+        self.data = definition['data'] if 'data' in definition else None
+
+        if self.data:
+            with span('create_map_from_data', setting=self.name, data=self.data):
+                self.create_map_from_data()
+
+        self.setup(definition)
+
+    def setup(self, definition):
+        self.key = definition['key']
+
+    def read(self):
+        raise NotImplementedError()
+
+    def write(self, value):
+        raise NotImplementedError()
+
+    def connect(self, callback):
+        self.callback = callback
+
+    def _callback(self, *args):
+        if self.callback is not None:
+            self.callback(self, self.get_value())
+
+    def watch(self, watcher):
+        """ Register the files this setting is stored in with a FileWatcher
+
+        Settings stored in a shared document are registered per document by the SettingsTree.
+        """
+        pass
+
+    @property
+    def resource(self):
+        """ The file, schema or path the value of this setting is stored in """
+        if self.document is not None:
+            return self.document.path
+        return self.key
+
+    def get_value(self):
+        with span('get_value', setting=self.name, page=self.page, backend=self.backend):
+            with metrics.timed(self.backend, 'get', self.resource):
+                try:
+                    value = self.read()
+                except Exception:
+                    log.error("Exception while loading %s/%s backend %s", self.name, self.type, self.backend)
+                    raise
+
+        if self.map:
+            for key in self.map:
+                if self.map[key] == value:
+                    value = key
+        return value
+
+    def set_value(self, value):
+        if self.map:
+            value = self.map[value]
+
+        with metrics.timed(self.backend, 'set', self.resource):
+            self.write(value)
+
+    def create_map_from_data(self):
+        if self.data == 'qt5platformthemes':
+            result = QtWidgets.QStyleFactory.keys()
+            self.map = {}
+            for theme in result:
+                self.map[theme] = theme
+            return
+
+        from danctnix_tweaks.themes import catalog, gtk_version
+
+        if self.data == 'gtk3themes':
+            if self.daemon:
+                return
+            themes = catalog(self.data, gtk_version())
+        else:
+            themes = catalog(self.data)
+
+        self.map = {}
+        if self.data == 'soundthemes':
+            self.map['Custom Profile'] = '__custom'
+        for name, theme in themes:
+            self.map[name] = theme
+
+    def __getitem__(self, item):
+        return getattr(self, item)
@@ -0,0 +1,45 @@
+from danctnix_tweaks.backends import register
+from danctnix_tweaks.backends.base import Setting
+from danctnix_tweaks.documents import get_document, CssDocument
+
+
+@register('css')
+class CssSetting(Setting):
+    """ A block of css rules in a user stylesheet, marked with guard comments """
+
+    __slots__ = ['selector', 'rules', 'guard', 'primary']
+
+    backend = 'css'
+
+    def setup(self, definition):
+        self.key = definition['key']
+        self.selector = definition['selector']
+        self.rules = definition['css']
+        self.guard = definition['guard']
+        self.document = get_document(CssDocument, self.key)
+        self.primary = None
+        for rule in self.rules:
+            if self.rules[rule] == '%':
+                self.primary = rule
+
+    def read(self):
+        value = self.document.get_rule(self.guard, self.primary)
+        if value is not None and value.startswith('url("'):
+            value = value[12:-2]
+        return value
+
+    def write(self, value):
+        if value is None:
+            self.document.set_block(self.guard, None)
+            return
+
+        if value.startswith('/'):
+            value = f'url("file://{value}")'
+        lines = [self.selector + ' {\n']
+        for rule in self.rules:
+            val = self.rules[rule]
+            if val == '%':
+                val = value
+            lines.append('\t' + rule + ': ' + val + ';\n')
+        lines.append('}\n')
+        self.document.set_block(self.guard, lines)
@@ -0,0 +1,26 @@
+import os
+
+from danctnix_tweaks.backends import register
+from danctnix_tweaks.backends.base import Setting
+from danctnix_tweaks.documents import get_document, EnvironmentDocument
+
+
+@register('environment')
+class EnvironmentSetting(Setting):
+    __slots__ = []
+
+    backend = 'environment'
+
+    def setup(self, definition):
+        self.key = definition['key']
+        self.document = get_document(EnvironmentDocument, '~/.pam_environment')
+
+    def read(self):
+        # The file is only applied on the next login, fall back to the current environment
+        value = self.document.get(self.key)
+        if value is None:
+            value = os.getenv(self.key, default='')
+        return value
+
+    def write(self, value):
+        self.document.set(self.key, value)
@@ -0,0 +1,90 @@
+import logging
+
+from danctnix_tweaks.backends import register
+from danctnix_tweaks.backends.base import Setting
+
+log = logging.getLogger(__name__)
+
+
+@register('gsettings')
+class GSettingsSetting(Setting):
+    __slots__ = ['gtype', 'base_key', '_schema', 'debounce', '_written']
+
+    backend = 'gsettings'
+
+    def setup(self, definition):
+        if self.daemon:
+            self.valid = False
+            return
+
+        self.gtype = definition['gtype'] if 'gtype' in definition else definition['type']
+
+        from danctnix_tweaks.gsettings import get_schema
+
+        if not isinstance(definition['key'], list):
+            definition['key'] = [definition['key']]
+        for key in definition['key']:
+            part = key.split('.')
+            self.base_key = '.'.join(part[0:-1])
+            self.key = part[-1]
+
+            self._schema = get_schema(self.base_key)
+            if self._schema is None or self.key not in self._schema.keys:
+                continue
+            break
+        else:
+            log.warning("None of the keys for %s exist: %s", self.name, ', '.join(definition['key']))
+            self.valid = False
+            return
+
+        # Writes of continuously changing widgets can be debounced, the changes are held
+        # back in delayed mode until the value hasn't changed for this many milliseconds
+        self.debounce = definition['debounce'] if 'debounce' in definition else None
+        self._written = None
+
+        self._schema.connect(self.key, self._callback)
+
+    def _callback(self, *args):
+        if self.callback is not None:
+            value = self.get_value()
+
+            # Don't report our own write back to the widget that made it, only the first change
+            # after a write can be its echo, later changes to the same value come from elsewhere
+            written = self._written
+            self._written = None
+            if value == written:
+                return
+            self.callback(self, value)
+
+    @property
+    def resource(self):
+        return self.base_key
+
+    def read(self):
+        settings = self._schema.reader()
+        if self.gtype == 'boolean':
+            return settings.get_boolean(self.key)
+        elif self.gtype == 'string':
+            return settings.get_string(self.key)
+        elif self.gtype == 'number':
+            return settings.get_int(self.key)
+        elif self.gtype == 'double':
+            return settings.get_double(self.key)
+
+    def set_value(self, value):
+        self._written = value
+        super().set_value(value)
+
+    def write(self, value):
+        if self.debounce:
+            self._schema.delay_apply(self.debounce)
+
+        settings = self._schema.writer(self.debounce)
+        if self.gtype == 'boolean':
+            settings.set_boolean(self.key, value)
+        elif self.gtype == 'string':
+            settings.set_string(self.key, value)
+        elif self.gtype == 'number':
+            settings.set_int(self.key, value)
+        elif self.gtype == 'double':
+            settings.set_double(self.key, value)
@@ -0,0 +1,25 @@
+import os
+
+from danctnix_tweaks.backends import register
+from danctnix_tweaks.backends.base import Setting
+from danctnix_tweaks.documents import get_document, IniDocument
+
+
+@register('gtk3settings')
+class Gtk3SettingsSetting(Setting):
+    __slots__ = ['file', 'default']
+
+    backend = 'gtk3settings'
+
+    def setup(self, definition):
+        self.key = definition['key']
+        self.file = os.path.join(os.getenv('XDG_CONFIG_HOME', '~/.config'), 'gtk-3.0/settings.ini')
+        self.file = os.path.expanduser(self.file)
+        self.default = definition['default'] if 'default' in definition else None
+        self.document = get_document(IniDocument, self.file)
+
+    def read(self):
+        return self.document.get('Settings', self.key, self.default)
+
+    def write(self, value):
+        self.document.set('Settings', self.key, value)
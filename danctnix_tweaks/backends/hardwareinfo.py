@@ -0,0 +1,14 @@
+from danctnix_tweaks.backends import register
+from danctnix_tweaks.backends.base import Setting
+
+
+@register('hardwareinfo')
+class HardwareInfoSetting(Setting):
+    __slots__ = []
+
+    backend = 'hardwareinfo'
+
+    def read(self):
+        from danctnix_tweaks.hardwareinfo import hardware_info
+
+        return hardware_info(self.key)
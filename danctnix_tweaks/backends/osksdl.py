@@ -0,0 +1,31 @@
+from danctnix_tweaks.backends import register
+from danctnix_tweaks.backends.base import Setting
+from danctnix_tweaks.oskconf import get_osk_config
+
+
+@register('osksdl')
+class OskSdlSetting(Setting):
+    """ A value in osk.conf, the value is only stored here and written by tweakd """
+
+    __slots__ = ['default']
+
+    backend = 'osksdl'
+    needs_root = True
+
+    def setup(self, definition):
+        self.key = definition['key']
+        self.default = definition['default']
+        self.document = get_osk_config()
+
+    def read(self):
+        value = self.document.get(self.key)
+        if value is None:
+            return self.default
+        if self.type == 'boolean':
+            value = value == 'true'
+        return value
+
+    def write(self, value):
+        if isinstance(value, float):
+            value = int(value)
+        self.value = value
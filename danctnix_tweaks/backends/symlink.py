@@ -0,0 +1,165 @@
+import os
+
+from danctnix_tweaks import documents
+from danctnix_tweaks import metrics
+from danctnix_tweaks.backends import register
+from danctnix_tweaks.backends.base import Setting
+
+# Link indexes by directory, shared by all symlink settings in the same directory
+_indexes = {}
+
+
+class LinkIndex:
+    """ The symlinks in a directory, read with a single scandir and kept until the directory changes """
+
+    __slots__ = ['path', 'mtime', 'links', 'bases']
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.links = None
+        self.bases = None
+
+    def refresh(self):
+        if self.links is not None and not documents.needs_check(self):
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self.links is not None and mtime == self.mtime:
+            return
+
+        links = {}
+        if mtime is not None:
+            with metrics.timed('symlink', 'read', self.path):
+                with os.scandir(self.path) as it:
+                    for entry in it:
+                        if entry.is_symlink():
+                            links[entry.name] = os.readlink(entry.path)
+
+        # Map the name without the extension to the target and extension of the link
+        bases = {}
+        for name in sorted(links):
+            if name.startswith('.') or '.' not in name:
+                continue
+            base, ext = name.rsplit('.', maxsplit=1)
+            bases.setdefault(base, (links[name], ext))
+
+        self.mtime = mtime
+        self.links = links
+        self.bases = bases
+
+    def invalidate(self):
+        self.links = None
+
+    def get(self, name):
+        self.refresh()
+        return self.links.get(name)
+
+    def get_base(self, base):
+        """ Get the (target, extension) of the link called base.<extension> """
+        self.refresh()
+        return self.bases.get(base, (None, None))
+
+
+def get_index(directory):
+    if directory not in _indexes:
+        _indexes[directory] = LinkIndex(directory)
+    return _indexes[directory]
+
+
+def replace_link(target, link):
+    """ Point link to target, the link is replaced with a rename so it always exists """
+    temp = os.path.join(os.path.dirname(link), f'.{os.path.basename(link)}.{os.getpid()}.tmp')
+    if os.path.lexists(temp):
+        os.unlink(temp)
+    os.symlink(target, temp)
+    os.replace(temp, link)
+
+
+@register('symlink')
+class SymlinkSetting(Setting):
+    __slots__ = ['format', 'source_ext', 'index', 'basename']
+
+    backend = 'symlink'
+
+    def setup(self, definition):
+        self.key = os.path.expanduser(definition['key'])
+        self.format = None
+        self.source_ext = definition['source_ext'] if 'source_ext' in definition else False
+        directory, self.basename = os.path.split(os.path.abspath(self.key))
+        self.index = get_index(directory)
+
+    def watch(self, watcher):
+        watcher.watch(self.key, self._callback, prefix=self.source_ext)
+
+    def read(self):
+        if not self.source_ext:
+            return self.index.get(self.basename)
+
+        # The extension is taken from the existing link so it's known after a restart
+        target, self.format = self.index.get_base(self.basename)
+        return target
+
+    def write(self, value):
+        try:
+            self._write(value)
+        finally:
+            # Don't depend on the mtime resolution to notice our own changes
+            self.index.invalidate()
+
+    def _write(self, value):
+        if value is None:
+            if self.source_ext:
+                self.read()
+                link = self.key + '.' + self.format if self.format else None
+            else:
+                link = self.key
+            if link is not None and os.path.islink(link):
+                os.unlink(link)
+            self.format = None
+            return
+
+        target = os.path.expanduser(value)
+        if not self.source_ext:
+            replace_link(target, self.key)
+            return
+
+        self.read()
+        previous = self.format
+        self.format = target.split('.')[-1]
+        replace_link(target, self.key + '.' + self.format)
+
+        # A link with a different extension would shadow the new one
+        if previous is not None and previous != self.format:
+            old = self.key + '.' + previous
+            if os.path.islink(old):
+                os.unlink(old)
+
+
+@register('soundtheme')
+class SoundThemeSetting(SymlinkSetting):
+    """ A symlink in a custom sound theme, the theme is created if it doesn't exist """
+
+    __slots__ = []
+
+    def setup(self, definition):
+        super().setup(definition)
+        self.source_ext = True
+
+        themedir = os.path.dirname(self.key)
+        themefile = os.path.join(themedir, 'index.theme')
+        if os.path.exists(themedir):
+            if not os.path.isfile(themefile):
+                self.valid = False
+            return
+
+        os.makedirs(themedir)
+        lines = []
+        lines.append('[Sound Theme]\n')
+        lines.append('Name=Custom Profile\n')
+        lines.append('Inherits=freedesktop\n')
+        lines.append('Directories=.\n')
+        with open(themefile, 'w') as handle:
+            handle.writelines(lines)
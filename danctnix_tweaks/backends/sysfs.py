@@ -0,0 +1,39 @@
+import os
+
+from danctnix_tweaks.backends import register
+from danctnix_tweaks.backends.base import Setting
+
+
+@register('sysfs')
+class SysfsSetting(Setting):
+    """ A sysfs attribute, the value is only stored here and written by tweakd """
+
+    __slots__ = ['stype', 'multiplier']
+
+    backend = 'sysfs'
+    needs_root = True
+
+    def setup(self, definition):
+        if not os.path.isfile(definition['key']):
+            self.valid = False
+            return
+
+        self.key = definition['key']
+        self.stype = definition['stype']
+        self.multiplier = definition['multiplier'] if 'multiplier' in definition else 1
+
+    def read(self):
+        with open(self.key, 'r') as handle:
+            raw = handle.read()
+        value = raw.rstrip('\0').strip()
+        if self.stype == 'int':
+            try:
+                value = int(value) / self.multiplier
+            except ValueError:
+                value = 0
+        self.value = value
+        return value
+
+    def write(self, value):
+        if self.stype == 'int':
+            self.value = value
@@ -0,0 +1,43 @@
+import os
+import pickle
+import logging
+
+from danctnix_tweaks.fileio import atomic_write
+
+# Bump this when the layout of any cached data changes
+CACHE_VERSION = 1
+
+log = logging.getLogger(__name__)
+
+
+def cache_dir():
+    if 'XDG_CACHE_HOME' in os.environ:
+        return os.path.join(os.environ['XDG_CACHE_HOME'], 'danctnix-tweaks')
+    if os.getuid() == 0:
+        return '/var/cache/danctnix-tweaks'
+    return os.path.expanduser('~/.cache/danctnix-tweaks')
+
+
+def load(name, key):
+    """ Return the cached data for name if it was stored with the same key, otherwise None """
+    path = os.path.join(cache_dir(), name)
+    try:
+        with open(path, 'rb') as handle:
+            stored_key, data = pickle.load(handle)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning("Ignoring corrupt cache %s: %s", path, e)
+        return None
+
+    if stored_key != (CACHE_VERSION, key):
+        return None
+    return data
+
+
+def store(name, key, data):
+    path = os.path.join(cache_dir(), name)
+    try:
+        atomic_write(path, pickle.dumps(((CACHE_VERSION, key), data), protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError as e:
+        log.warning("Could not write cache %s: %s", path, e)
@@ -0,0 +1,84 @@
+import logging
+from collections import OrderedDict
+
+from danctnix_tweaks import documents
+
+log = logging.getLogger(__name__)
+
+
+class ChangeSet:
+    """ Collects setting changes so they can be written together or dropped """
+
+    def __init__(self):
+        self.changes = OrderedDict()
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __contains__(self, setting):
+        return setting in self.changes
+
+    @property
+    def needs_root(self):
+        for setting in self.changes:
+            if setting.needs_root:
+                return True
+        return False
+
+    def stage(self, setting, value):
+        self.changes[setting] = value
+
+    def discard(self, setting):
+        """ Drop the staged change of a single setting, returns False if it had none """
+        if setting not in self.changes:
+            return False
+        del self.changes[setting]
+        return True
+
+    def commit(self):
+        """ Write all staged changes
+
+        The writes to every gsettings schema are held back so each schema gets a single apply,
+        and all file backed changes are written with a single write per file. If anything fails
+        the values that were already changed are restored.
+        """
+        held = []
+        previous = []
+        try:
+            with documents.batch():
+                for setting, value in self.changes.items():
+                    if setting.backend == 'gsettings' and setting._schema not in held:
+                        setting._schema.hold()
+                        held.append(setting._schema)
+                    # The raw value is restored with write(), it doesn't have to be in the map
+                    try:
+                        previous.append((setting, setting.read()))
+                    except Exception as e:
+                        log.warning("Could not read %s, it won't be restored if the commit fails: %s",
+                                    setting.name, e)
+                    setting.set_value(value)
+            while held:
+                held.pop(0).release()
+        except Exception:
+            # The held gsettings keys get their previous value back, other pending writes to the
+            # same schemas are still applied
+            try:
+                with documents.batch():
+                    for setting, value in previous:
+                        try:
+                            setting.write(value)
+                        except Exception as e:
+                            log.error("Could not restore %s: %s", setting.name, e)
+            except Exception as e:
+                log.error("Could not restore the previous values: %s", e)
+            for schema in held:
+                schema.release()
+            raise
+
+        self.changes.clear()
+
+    def rollback(self):
+        """ Drop all staged changes, returns the settings that had changes """
+        settings = list(self.changes)
+        self.changes.clear()
+        return settings
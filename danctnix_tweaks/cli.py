@@ -0,0 +1,257 @@
+import sys
+import json
+import logging
+import argparse
+
+from danctnix_tweaks import documents
+from danctnix_tweaks.backends.base import parse_value, check_value
+from danctnix_tweaks.settingstree import SettingsTree, definition_dirs
+
+log = logging.getLogger(__name__)
+
+
+def no_match(error):
+    log.error("No settings match %s", error.args[0])
+    return 2
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def describe(path, setting):
+    result = {
+        'path': path,
+        'type': setting.type,
+        'backend': setting.backend,
+        'needs_root': setting.needs_root,
+    }
+    if setting.help:
+        result['help'] = setting.help
+    if setting.map:
+        result['choices'] = list(setting.map)
+    for key in ['min', 'max', 'step']:
+        if key in setting.definition:
+            result[key] = setting.definition[key]
+    return result
+
+
+def cmd_list(tree, args):
+    try:
+        settings = tree.find(args.paths or None)
+    except KeyError as e:
+        return no_match(e)
+    if args.json:
+        json.dump([describe(path, setting) for path, setting in settings], sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return 0
+    for path, setting in settings:
+        print(f'{path}\t{setting.type}\t{setting.backend}')
+    return 0
+
+
+def cmd_get(tree, args):
+    try:
+        settings = tree.find(args.paths)
+    except KeyError as e:
+        return no_match(e)
+    values = tree.get_values([path for path, setting in settings])
+    if args.json:
+        json.dump(values, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    elif len(args.paths) == 1 and len(values) == 1:
+        print(format_value(next(iter(values.values()))))
+    else:
+        for path, value in values.items():
+            print(f'{path}: {format_value(value)}')
+    return 0
+
+
+def cmd_dump(tree, args):
+    try:
+        settings = tree.find(args.paths or None)
+    except KeyError as e:
+        return no_match(e)
+    # Only the settings that can be changed, the output can be loaded again with set --file
+    paths = [path for path, setting in settings if setting.type != 'info']
+    json.dump(tree.get_values(paths), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+def cmd_set(tree, args):
+    values = {}
+    if args.file is not None:
+        if args.file == '-':
+            values.update(json.load(sys.stdin))
+        else:
+            with open(args.file) as handle:
+                values.update(json.load(handle))
+    raw = {}
+    for assignment in args.assignments:
+        if '=' not in assignment:
+            log.error("Expected PATH=VALUE, got %s", assignment)
+            return 2
+        path, value = assignment.split('=', maxsplit=1)
+        raw[path] = value
+
+    # Check everything before changing anything
+    changes = {}
+    for path in list(values) + list(raw):
+        try:
+            settings = tree.find([path])
+        except KeyError:
+            settings = []
+        if len(settings) != 1 or settings[0][0] != path.strip('/'):
+            log.error("%s is not a setting", path)
+            return 2
+        setting = settings[0][1]
+        if setting.type == 'info':
+            log.error("%s is read-only", path)
+            return 2
+        try:
+            if path in raw:
+                value = parse_value(setting, raw[path])
+            else:
+                value = check_value(setting, values[path])
+        except ValueError as e:
+            log.error("Invalid value for %s: %s", path, e)
+            return 2
+        if setting.map and value not in setting.map:
+            log.error("Invalid value for %s, expected one of: %s", path, ', '.join(setting.map))
+            return 2
+        changes[path] = value
+
+    tree.set_values(changes)
+    return commit(tree)
+
+
+def commit(tree):
+    """ Write the staged changes and make tweakd apply the ones that need root """
+    needs_root = tree.changes.needs_root
+    try:
+        tree.commit()
+    except Exception as e:
+        # The values that were already written have been restored
+        log.error("Could not apply the changes: %s", e)
+        return 1
+
+    if 'danctnix_tweaks.gsettings' in sys.modules:
+        from danctnix_tweaks.gsettings import sync
+        sync()
+
+    if needs_root:
+        import io
+        from danctnix_tweaks import ipc
+
+        config = io.StringIO()
+        tree.save_tweakd_config(config)
+        error = ipc.apply(config.getvalue())
+        if error is not None:
+            log.error("tweakd: %s", error)
+            return 1
+    return 0
+
+
+def cmd_profile(tree, args):
+    from danctnix_tweaks import profiles
+
+    if args.action == 'list':
+        names = profiles.list_profiles()
+        if args.json:
+            json.dump(names, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        else:
+            for name in names:
+                print(name)
+        return 0
+
+    if args.name is None:
+        log.error("The %s action needs a profile name", args.action)
+        return 2
+
+    if args.action == 'save':
+        try:
+            values = profiles.capture(tree, args.paths or None)
+        except KeyError as e:
+            return no_match(e)
+        try:
+            profiles.save(args.name, values)
+        except ValueError as e:
+            log.error("%s", e)
+            return 2
+        return 0
+
+    try:
+        if args.action == 'delete':
+            profiles.delete(args.name)
+            return 0
+        values = profiles.load(args.name)
+    except (OSError, ValueError) as e:
+        log.error("%s", e)
+        return 2
+    except KeyError as e:
+        if e.args[0] != args.name:
+            raise
+        log.error("No profile called %s", args.name)
+        return 2
+
+    changed = profiles.apply(tree, values)
+    for path in changed:
+        log.info("Changed %s", path)
+    return commit(tree)
+
+
+def main(version, datadir=None):
+    parser = argparse.ArgumentParser(description="Read and change the DanctNIX Tweaks settings")
+    parser.add_argument('--definitions', action='append', metavar='DIR',
+                        help="Load the setting definitions from this directory instead of the default ones")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show debug messages")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('list', help="List the settings")
+    command.add_argument('paths', nargs='*', metavar='PATH', help="Page, page/section or page/section/setting")
+    command.add_argument('--json', action='store_true', help="Output JSON")
+    command.set_defaults(func=cmd_list)
+
+    command = commands.add_parser('get', help="Print the value of settings")
+    command.add_argument('paths', nargs='+', metavar='PATH', help="Page, page/section or page/section/setting")
+    command.add_argument('--json', action='store_true', help="Output JSON")
+    command.set_defaults(func=cmd_get)
+
+    command = commands.add_parser('set', help="Change settings")
+    command.add_argument('assignments', nargs='*', metavar='PATH=VALUE')
+    command.add_argument('--file', help="Read a JSON object of paths and values, - for stdin")
+    command.set_defaults(func=cmd_set)
+
+    command = commands.add_parser('dump', help="Print all changeable values as JSON, the output can be used with set --file")
+    command.add_argument('paths', nargs='*', metavar='PATH', help="Page, page/section or page/section/setting")
+    command.set_defaults(func=cmd_dump)
+
+    command = commands.add_parser('profile', help="Save the current values as a profile or switch to a profile")
+    command.add_argument('action', choices=['list', 'save', 'apply', 'delete'])
+    command.add_argument('name', nargs='?')
+    command.add_argument('paths', nargs='*', metavar='PATH',
+                         help="Only save the settings under these paths, all settings by default")
+    command.add_argument('--json', action='store_true', help="Output JSON")
+    command.set_defaults(func=cmd_profile)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format='%(message)s')
+
+    tree = SettingsTree(staged=True)
+    for path in args.definitions or definition_dirs(datadir):
+        tree.load_dir(path)
+
+    try:
+        return args.func(tree, args)
+    finally:
+        documents.flush()
+
+
+if __name__ == '__main__':
+    sys.exit(main(None))
@@ -0,0 +1,79 @@
+import os
+import glob
+import logging
+
+from danctnix_tweaks import cache
+from danctnix_tweaks.tracing import span
+
+log = logging.getLogger(__name__)
+
+
+def _load_yaml(raw):
+    import yaml
+
+    # The C implementation of the loader is a lot faster if libyaml is available
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(raw, Loader=loader)
+
+
+def _merge(files):
+    # Merge pages and sections with the same name from all files in the directory. Settings are
+    # not deduplicated here since a later definition with the same name is used if the first one
+    # is not valid on this device
+    pages = {}
+    for file in files:
+        log.debug("Loading %s", file)
+        with open(file) as handle:
+            with span('parse yaml', file=file):
+                data = _load_yaml(handle.read())
+
+        for page in data or []:
+            if page['name'] not in pages:
+                pages[page['name']] = {
+                    'name': page['name'],
+                    'weight': page['weight'] if 'weight' in page else 50,
+                    'sections': {}
+                }
+            sections = pages[page['name']]['sections']
+
+            for section in page['sections']:
+                if section['name'] not in sections:
+                    sections[section['name']] = {
+                        'name': section['name'],
+                        'weight': section['weight'] if 'weight' in section else 50,
+                        'settings': []
+                    }
+                sections[section['name']]['settings'].extend(section['settings'])
+
+    result = []
+    for page in pages.values():
+        page['sections'] = list(page['sections'].values())
+        result.append(page)
+    return result
+
+
+def load_definitions(path):
+    """ Load the merged setting definitions of all the .yml files in a directory
+
+    The result is cached and is only rebuilt when the list of files or the mtime or size of
+    one of the files changes.
+    """
+    files = sorted(glob.glob(os.path.join(path, '*.yml')))
+    key = []
+    for file in files:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            continue
+        key.append((file, stat.st_mtime_ns, stat.st_size))
+
+    if len(key) == 0:
+        return []
+
+    path = os.path.abspath(path)
+    name = 'definitions' + path.replace('/', '-')
+    definitions = cache.load(name, key)
+    if definitions is None:
+        definitions = _merge([f[0] for f in key])
+        cache.store(name, key, definitions)
+    return definitions
@@ -0,0 +1,340 @@
+import io
+import os
+import atexit
+import logging
+import contextlib
+import threading
+import configparser
+
+from danctnix_tweaks import metrics
+from danctnix_tweaks.fileio import atomic_write
+
+log = logging.getLogger(__name__)
+
+_documents = {}
+_dirty = []
+_scheduler = None
+_scheduled = False
+_batch_depth = 0
+_reading_depth = 0
+_checked = set()
+_lock = threading.RLock()
+
+
+def set_flush_scheduler(scheduler):
+    """ Set the function used to defer writing changed documents, like GLib.idle_add
+
+    All the changes made before the scheduled callback runs are written with a single write per
+    file. Without a scheduler every change is written immediately.
+    """
+    global _scheduler
+    _scheduler = scheduler
+
+
+def get_document(cls, path):
+    """ Get the shared document instance for a file """
+    path = os.path.abspath(os.path.expanduser(path))
+    with _lock:
+        if (cls, path) not in _documents:
+            _documents[(cls, path)] = cls(path)
+        return _documents[(cls, path)]
+
+
+def flush():
+    global _scheduled
+    with _lock:
+        _scheduled = False
+        dirty = list(_dirty)
+        _dirty.clear()
+    for document in dirty:
+        document.write()
+    return False
+
+
+@contextlib.contextmanager
+def batch():
+    """ Hold back all document writes until the end of the block, then write each file once """
+    global _batch_depth
+    with _lock:
+        _batch_depth += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _batch_depth -= 1
+            done = _batch_depth == 0
+        if done:
+            flush()
+
+
+@contextlib.contextmanager
+def reading():
+    """ Check every document for changes on disk only once during the block
+
+    Used for reading many values at once, the files are then stat'ed and parsed at most once.
+    """
+    global _reading_depth
+    with _lock:
+        _reading_depth += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _reading_depth -= 1
+            if _reading_depth == 0:
+                _checked.clear()
+
+
+def needs_check(resource):
+    """ Returns False if resource was already checked for changes in the current reading() block """
+    if _reading_depth == 0:
+        return True
+    with _lock:
+        if resource in _checked:
+            return False
+        _checked.add(resource)
+        return True
+
+
+def _mark_dirty(document):
+    global _scheduled
+    with _lock:
+        if document not in _dirty:
+            _dirty.append(document)
+        if _batch_depth > 0:
+            return
+        if _scheduler is None:
+            schedule = False
+        else:
+            schedule = not _scheduled
+            _scheduled = True
+    if _scheduler is None:
+        flush()
+    elif schedule:
+        _scheduler(flush)
+
+
+atexit.register(flush)
+
+
+class Document:
+    """ In-memory copy of a config file that is shared by all settings stored in it
+
+    The file is parsed again when its mtime or size changes and is written back atomically.
+    """
+
+    # The backend the file I/O is counted for in the metrics
+    kind = 'file'
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        self.loaded = False
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def refresh(self):
+        """ Re-read the file if it changed on disk, returns True if it was parsed again """
+        with self.lock:
+            if self.dirty:
+                return False
+            if not needs_check(self):
+                return False
+            signature = self._stat()
+            if self.loaded and signature == self.signature:
+                return False
+
+            raw = None
+            if signature is not None:
+                with metrics.timed(self.kind, 'read', self.path):
+                    with open(self.path) as handle:
+                        raw = handle.read()
+            self.parse(raw)
+            self.signature = signature
+            self.loaded = True
+            return True
+
+    def changed(self):
+        with self.lock:
+            self.dirty = True
+        _mark_dirty(self)
+
+    def write(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            with metrics.timed(self.kind, 'write', self.path):
+                atomic_write(self.path, self.serialize())
+            log.debug("Wrote %s", self.path)
+            self.dirty = False
+            self.signature = self._stat()
+
+    def discard(self):
+        """ Drop the changes that weren't written, the file is read again on the next access """
+        with self.lock:
+            self.dirty = False
+            self.loaded = False
+        with _lock:
+            if self in _dirty:
+                _dirty.remove(self)
+
+    def parse(self, raw):
+        raise NotImplementedError()
+
+    def serialize(self):
+        raise NotImplementedError()
+
+
+class IniDocument(Document):
+    kind = 'gtk3settings'
+
+    def parse(self, raw):
+        self.ini = configparser.ConfigParser(interpolation=None)
+        if raw is not None:
+            self.ini.read_string(raw, source=self.path)
+
+    def serialize(self):
+        result = io.StringIO()
+        self.ini.write(result)
+        return result.getvalue()
+
+    def get(self, section, key, default=None):
+        with self.lock:
+            self.refresh()
+            return self.ini.get(section, key, fallback=default)
+
+    def set(self, section, key, value):
+        with self.lock:
+            self.refresh()
+            if not self.ini.has_section(section):
+                self.ini.add_section(section)
+            if self.ini.get(section, key, fallback=None) == value:
+                return
+            self.ini.set(section, key, value)
+        self.changed()
+
+
+class EnvironmentDocument(Document):
+    """ A pam_environment style file with one export KEY=value line per variable """
+
+    kind = 'environment'
+
+    def parse(self, raw):
+        self.lines = []
+        self.index = {}
+        if raw is not None:
+            self.lines = raw.splitlines(keepends=True)
+        for i, line in enumerate(self.lines):
+            if line.startswith('export ') and '=' in line:
+                key = line[7:].split('=', maxsplit=1)[0]
+                self.index.setdefault(key, i)
+
+    def serialize(self):
+        return ''.join(self.lines)
+
+    def get(self, key, default=None):
+        with self.lock:
+            self.refresh()
+            if key not in self.index:
+                return default
+            return self.lines[self.index[key]].split('=', maxsplit=1)[1].rstrip('\n')
+
+    def set(self, key, value):
+        line = f'export {key}={value}\n'
+        with self.lock:
+            self.refresh()
+            if key in self.index:
+                if self.lines[self.index[key]] == line:
+                    return
+                self.lines[self.index[key]] = line
+            else:
+                if len(self.lines) > 0 and not self.lines[-1].endswith('\n'):
+                    self.lines[-1] += '\n'
+                self.index[key] = len(self.lines)
+                self.lines.append(line)
+        self.changed()
+
+
+class CssDocument(Document):
+    """ A css file with blocks managed by tweaks between TWEAKS-START and TWEAKS-END guard comments
+
+    The file is kept as a list of chunks of user content and guarded blocks so updating a block
+    only replaces the lines of that block.
+    """
+
+    kind = 'css'
+
+    def parse(self, raw):
+        # Each chunk is either a list of user content lines or the name of a guarded block
+        self.chunks = []
+        self.blocks = {}
+        lines = raw.splitlines(keepends=True) if raw is not None else []
+        current = None
+        content = []
+        for line in lines:
+            stripped = line.strip()
+            if current is None and stripped.startswith('/* TWEAKS-START ') and stripped.endswith(' */'):
+                if content:
+                    self.chunks.append(content)
+                    content = []
+                current = stripped[16:-3]
+                self.blocks[current] = []
+                self.chunks.append(current)
+            elif current is not None and stripped == f'/* TWEAKS-END {current} */':
+                current = None
+            elif current is not None:
+                self.blocks[current].append(line)
+            else:
+                content.append(line)
+        if content:
+            self.chunks.append(content)
+
+    def serialize(self):
+        result = []
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                result.append(f'/* TWEAKS-START {chunk} */\n')
+                result.extend(self.blocks[chunk])
+                result.append(f'/* TWEAKS-END {chunk} */\n')
+            else:
+                result.extend(chunk)
+        return ''.join(result)
+
+    def get_rule(self, guard, rule):
+        """ Get the value of a css rule inside a guarded block """
+        with self.lock:
+            self.refresh()
+            if guard not in self.blocks:
+                return None
+            value = None
+            for line in self.blocks[guard]:
+                if line.strip().startswith(rule):
+                    value = line.strip().split(':', maxsplit=1)[1].strip()[:-1]
+            return value
+
+    def set_block(self, guard, lines):
+        """ Replace the contents of a guarded block, None removes the block """
+        with self.lock:
+            self.refresh()
+            if lines is None:
+                if guard not in self.blocks:
+                    return
+                del self.blocks[guard]
+                self.chunks.remove(guard)
+            elif guard in self.blocks:
+                if self.blocks[guard] == lines:
+                    return
+                self.blocks[guard] = lines
+            else:
+                if self.chunks and not isinstance(self.chunks[-1], str) and not self.chunks[-1][-1].endswith('\n'):
+                    self.chunks[-1][-1] += '\n'
+                self.blocks[guard] = lines
+                self.chunks.append(guard)
+        self.changed()
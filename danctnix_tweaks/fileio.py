@@ -0,0 +1,23 @@
+import os
+
+
+def atomic_write(path, data):
+    # Write to a temporary file next to the target and rename it over the original so readers
+    # never see a half-written file
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    mode = 0o644
+    if os.path.exists(path):
+        mode = os.stat(path).st_mode & 0o777
+
+    temp = os.path.join(directory, f'.{os.path.basename(path)}.{os.getpid()}.tmp')
+    fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as handle:
+            handle.write(data)
+        os.chmod(temp, mode)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
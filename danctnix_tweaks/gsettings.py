@@ -0,0 +1,114 @@
+import gi
+
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gio, GLib
+
+from danctnix_tweaks.tracing import span
+
+# Shared Schema objects by schema id, None if the schema isn't installed
+_schemas = {}
+
+# Schemas with debounced writes that haven't been applied yet
+_delayed = set()
+
+
+class Schema:
+    """ A single Gio.Settings object shared by all settings in the same schema
+
+    There is one changed handler per schema that is dispatched to the callbacks registered for
+    the key that changed.
+    """
+
+    def __init__(self, schema_id, schema):
+        self.id = schema_id
+        self.keys = frozenset(schema.list_keys())
+        self.settings = Gio.Settings.new(schema_id)
+        self.listeners = {}
+
+        # Held back and debounced writes go to a second object in delayed mode, delay() can't be
+        # undone and the shared object has to keep writing directly for the other settings
+        self.delayed = None
+        self.holds = 0
+        self.timer = None
+        self.settings.connect('changed', self._on_changed)
+
+    def connect(self, key, callback):
+        self.listeners.setdefault(key, []).append(callback)
+
+    def _on_changed(self, settings, key):
+        for callback in self.listeners.get(key, []):
+            callback()
+
+    def _delayed_settings(self):
+        if self.delayed is None:
+            self.delayed = Gio.Settings.new(self.id)
+            self.delayed.delay()
+        return self.delayed
+
+    def hold(self):
+        """ Hold back all writes to this schema until the matching release() """
+        self._delayed_settings()
+        self.holds += 1
+
+    def release(self):
+        """ Apply the held back writes once every hold is released """
+        self.holds -= 1
+        if self.holds == 0:
+            self.apply()
+
+    def writer(self, debounce=False):
+        """ The Gio.Settings object a write goes to, debounced and held writes are delayed """
+        if self.holds or debounce:
+            return self._delayed_settings()
+        return self.settings
+
+    def reader(self):
+        """ The Gio.Settings object to read from, includes the writes that weren't applied yet """
+        if self.delayed is not None and self.delayed.get_has_unapplied():
+            return self.delayed
+        return self.settings
+
+    def delay_apply(self, timeout):
+        """ Apply the debounced writes once nothing was written for timeout ms """
+        if self.timer is None:
+            _delayed.add(self)
+        else:
+            GLib.source_remove(self.timer)
+        self.timer = GLib.timeout_add(timeout, self._on_timeout)
+
+    def _cancel(self):
+        if self.timer is not None:
+            GLib.source_remove(self.timer)
+            self.timer = None
+        _delayed.discard(self)
+
+    def apply(self):
+        self._cancel()
+        if self.delayed is not None:
+            self.delayed.apply()
+
+    def _on_timeout(self):
+        self.timer = None
+        self.apply()
+        return False
+
+
+def get_schema(schema_id):
+    if schema_id not in _schemas:
+        with span('gsettings lookup', schema=schema_id):
+            source = Gio.SettingsSchemaSource.get_default()
+            schema = source.lookup(schema_id, True)
+            _schemas[schema_id] = Schema(schema_id, schema) if schema is not None else None
+    return _schemas[schema_id]
+
+
+def apply_delayed():
+    """ Apply all pending debounced writes """
+    for schema in list(_delayed):
+        schema.apply()
+
+
+def sync():
+    """ Apply the pending writes and wait until they have been stored, needed before exiting """
+    apply_delayed()
+    Gio.Settings.sync()
@@ -0,0 +1,234 @@
+import os
+import glob
+import logging
+import threading
+
+from danctnix_tweaks import cache
+
+# Prefix for all the paths that are probed, used to run against a fake system tree
+SYSROOT = ''
+
+# These can't change without a reboot, so the results are cached per boot
+BOOT_CONSTANT = ['model', 'memory', 'cpu', 'chipset', 'gpu', 'kernel', 'distro']
+
+# Seconds the GPU renderer helper may run, it stays within the time budget of the value loader
+HELPER_TIMEOUT = 2
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_boot_id = None
+_values = None
+
+
+def get_file_contents(path):
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as handle:
+            return handle.read().strip()
+    except:
+        return None
+
+
+def probe(key):
+    GB = 1024 * 1024 * 1024
+
+    if key == 'model':
+        dmidir = SYSROOT + '/sys/devices/virtual/dmi/id'
+        if os.path.isdir(dmidir):
+            manufacturer = get_file_contents(os.path.join(dmidir, 'chassis_vendor')) or ''
+            model = get_file_contents(os.path.join(dmidir, 'product_name')) or ''
+            return '{} {}'.format(manufacturer, model).strip()
+        if os.path.isdir(SYSROOT + '/proc/device-tree'):
+            return get_file_contents(SYSROOT + '/proc/device-tree/model')
+    elif key == 'memory':
+        memdir = SYSROOT + '/sys/devices/system/memory'
+        if os.path.isdir(memdir):
+            blocks = 0
+            for block in glob.glob(os.path.join(memdir, 'memory*/online')):
+                blocks += 1
+            blocksize = get_file_contents(os.path.join(memdir, 'block_size_bytes'))
+            blocksize_byes = int(blocksize, 16)
+            memory_bytes = blocks * blocksize_byes
+        else:
+            meminfo = dict((i.split()[0].rstrip(':'), int(i.split()[1])) for i in open(SYSROOT + '/proc/meminfo').readlines())
+            mem_kib = meminfo['MemTotal']
+            memory_bytes = mem_kib * 1024
+        if memory_bytes > GB:
+            return "{:.1f} GB".format(memory_bytes / GB)
+        else:
+            return "{:.0f} MB".format(memory_bytes / GB * 1024)
+
+    elif key == 'cpu':
+        return probe_cpus()
+    elif key == 'chipset':
+        return probe_chipset()
+    elif key == 'disk':
+        stats = os.statvfs(SYSROOT + '/')
+        total_bytes = stats.f_frsize * stats.f_blocks
+        disk_size = total_bytes / GB
+        return str(round(disk_size, 2)) + " GB"
+    elif key == 'gpu':
+        import subprocess
+
+        paths = [SYSROOT + '/usr/libexec/gnome-control-center-print-renderer',
+                 SYSROOT + '/usr/lib/gnome-control-center-print-renderer']
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            try:
+                result = subprocess.check_output([path], timeout=HELPER_TIMEOUT).decode().strip()
+                return result
+            except subprocess.TimeoutExpired:
+                # Not cached, the helper might work the next time
+                log.warning("%s did not finish within %d seconds", path, HELPER_TIMEOUT)
+                raise
+            except Exception as e:
+                log.warning("Could not run %s: %s", path, e)
+    elif key == 'kernel':
+        import platform
+
+        return platform.release()
+    elif key == 'architecture':
+        import platform
+
+        lut = {
+            'aarch64': 'ARM64'
+        }
+        arch = platform.machine()
+        if arch in lut:
+            return lut[arch]
+        else:
+            return arch
+    elif key == 'distro':
+        if os.path.isfile(SYSROOT + '/etc/os-release'):
+            with open(SYSROOT + '/etc/os-release') as handle:
+                raw = handle.read()
+            for line in raw.splitlines():
+                if line.startswith("PRETTY_NAME="):
+                    return line.split('=', maxsplit=1)[1].replace('"', '').strip()
+    return 'N/A'
+
+
+def probe_cpus():
+    import danctnix_tweaks.cpus as cpu_data
+
+    cpus = {}
+    raw = get_file_contents(SYSROOT + '/proc/cpuinfo')
+    buffer = {}
+    arm_names = [
+        'CPU implementer',
+        'CPU architecture',
+        'CPU variant',
+        'CPU part',
+        'CPU revision',
+    ]
+    for line in list(raw.splitlines()) + [""]:
+        if line.strip() == '':
+            if 'CPU implementer' in buffer:
+                implementer = int(buffer['CPU implementer'], 16)
+                part = int(buffer['CPU part'], 16)
+                if implementer in cpu_data.arm_implementer:
+                    model = cpu_data.arm_implementer[implementer]
+                    if part in cpu_data.arm_part[implementer]:
+                        model += ' ' + cpu_data.arm_part[implementer][part]
+                    else:
+                        model += ' unknown core'
+                else:
+                    model = 'unknown cpu'
+                if model in cpus:
+                    cpus[model] += 1
+                else:
+                    cpus[model] = 1
+            buffer = {}
+        if line.startswith('model name'):
+            _, val = line.split(':')
+            name = val.strip()
+            if name in cpus:
+                cpus[name] += 1
+            else:
+                cpus[name] = 1
+        for field in arm_names:
+            if line.startswith(field):
+                key, val = line.split(':')
+                buffer[key.strip()] = val.strip()
+
+    result = ''
+    for cpu in cpus:
+        result += f'{cpus[cpu]}x {cpu}\n'
+    return result.strip()
+
+
+def probe_chipset():
+    import danctnix_tweaks.socs as soc_data
+
+    # Qualcomm / socinfo
+    if os.path.isdir(SYSROOT + '/sys/devices/soc0'):
+        machine = get_file_contents(SYSROOT + '/sys/devices/soc0/machine')
+        family = get_file_contents(SYSROOT + '/sys/devices/soc0/family')
+        if machine is not None:
+            if family is None:
+                return machine
+            else:
+                return f"{family} {machine}"
+
+    # Guess based on the device tree
+    if os.path.isdir(SYSROOT + '/proc/device-tree'):
+        compatible = get_file_contents(SYSROOT + '/proc/device-tree/compatible')
+        part = compatible.rstrip('\0').split('\0')
+        manufacturer, part = part[-1].split(',', maxsplit=1)
+        return soc_data.get_soc_name(manufacturer, part)
+    return "N/A"
+
+
+def _get_boot_id():
+    try:
+        with open(SYSROOT + '/proc/sys/kernel/random/boot_id') as handle:
+            return handle.read().strip()
+    except OSError:
+        return None
+
+
+def _load():
+    global _boot_id, _values
+    if _values is None:
+        _boot_id = _get_boot_id()
+        _values = {}
+        if _boot_id is not None:
+            _values = cache.load('hardwareinfo', _boot_id) or {}
+    return _values
+
+
+def hardware_info(key):
+    """ Get a hardware info value, using the boot scoped cache for values that can't change """
+    if key not in BOOT_CONSTANT:
+        return probe(key)
+
+    with _lock:
+        values = _load()
+        if key in values:
+            return values[key]
+
+    # Values that aren't available on this device are cached as N/A so they aren't probed again
+    value = probe(key)
+    if value is None:
+        value = 'N/A'
+
+    with _lock:
+        values[key] = value
+        if _boot_id is not None:
+            cache.store('hardwareinfo', _boot_id, dict(values))
+    return value
+
+
+def prefetch():
+    """ Run all the expensive probes once so opening the About page only reads the cache """
+    with _lock:
+        values = _load()
+        missing = [key for key in BOOT_CONSTANT if key not in values]
+    for key in missing:
+        try:
+            hardware_info(key)
+        except Exception as e:
+            log.warning("Could not probe %s: %s", key, e)
@@ -0,0 +1,59 @@
+SOCKET = '/run/danctnix-tweakd.sock'
+
+# Seconds to wait for the resident tweakd to apply a config, this includes a polkit prompt
+APPLY_TIMEOUT = 60
+
+
+def request(message, path=SOCKET, timeout=None):
+    """ Send a request to the resident tweakd and return its response
+
+    Raises OSError if the daemon isn't running.
+    """
+    import json
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        raw = b''
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            raw += data
+    return json.loads(raw.decode())
+
+
+def apply(config, path=SOCKET):
+    """ Make tweakd store and apply config, the contents of tweakd.conf
+
+    The resident tweakd applies it directly, if it isn't running tweakd is restarted through
+    pkexec. Returns None on success or the error reported by tweakd.
+    """
+    try:
+        response = request({'action': 'apply', 'config': config}, path=path, timeout=APPLY_TIMEOUT)
+        if response['status'] != 'ok':
+            return response['message']
+        return None
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+    except TimeoutError:
+        # The request was sent and might still be applied, running it again would ask for
+        # authorization a second time
+        return "tweakd did not answer in time"
+    except (OSError, ValueError) as e:
+        return f"Could not talk to tweakd: {e}"
+
+    import subprocess
+    import tempfile
+
+    fd, filename = tempfile.mkstemp()
+    with open(fd, 'w') as handle:
+        handle.write(config)
+
+    result = subprocess.run(['pkexec', 'pk-tweaks-action', filename])
+    if result.returncode != 0:
+        return f"pkexec exited with status {result.returncode}"
+    return None
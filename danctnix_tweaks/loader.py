@@ -0,0 +1,111 @@
+import queue
+import threading
+
+import gi
+
+gi.require_version('Gtk', '3.0')
+from gi.repository import GLib
+
+# Returned to the callback when the value could not be read within the time budget
+UNAVAILABLE = object()
+
+# Time budget in milliseconds for reading a value on the worker pool. Backends not listed here
+# are cheap to read and are loaded directly on the main thread
+BACKEND_TIMEOUT = {
+    'hardwareinfo': 3000,
+    'sysfs': 1000,
+    'osksdl': 1000,
+}
+
+
+class ValueLoader:
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.queue = None
+        self.lock = threading.Lock()
+
+    def timeout_for(self, setting):
+        # A timeout in the setting definition overrides the default for the backend
+        if 'timeout' in setting.definition:
+            return setting.definition['timeout']
+        return BACKEND_TIMEOUT.get(setting.backend)
+
+    def load(self, setting, callback):
+        """ Read the value of a setting and call callback(setting, value) on the main loop
+
+        If the value can't be read within the time budget of the backend the callback gets
+        UNAVAILABLE instead, a result that arrives after that is dropped. The budget starts when
+        a worker starts reading the value, not while it is queued.
+        """
+        timeout = self.timeout_for(setting)
+        if timeout is None:
+            try:
+                value = setting.get_value()
+            except Exception:
+                value = UNAVAILABLE
+            callback(setting, value)
+            return
+
+        # Both the result and the timeout are delivered on the main loop, whichever comes first wins
+        state = {'done': False, 'timer': None, 'finished': False, 'stuck': False}
+
+        def deliver(value):
+            if state['done']:
+                return False
+            state['done'] = True
+            if state['timer'] is not None:
+                GLib.source_remove(state['timer'])
+            callback(setting, value)
+            return False
+
+        def expire():
+            with self.lock:
+                if state['finished']:
+                    # The value is already on its way
+                    state['timer'] = None
+                    return False
+                state['stuck'] = True
+            state['done'] = True
+            # The worker is stuck on this value, start another one so the queued values still load
+            self._start_worker()
+            callback(setting, UNAVAILABLE)
+            return False
+
+        def work():
+            state['timer'] = GLib.timeout_add(timeout, expire)
+            try:
+                value = setting.get_value()
+            except Exception:
+                value = UNAVAILABLE
+            with self.lock:
+                state['finished'] = True
+                if state['stuck']:
+                    # A replacement was started for this worker, it can exit
+                    return True
+            GLib.idle_add(deliver, value)
+            return False
+
+        # The workers are only started when the first slow value is requested
+        if self.queue is None:
+            self.queue = queue.SimpleQueue()
+            for i in range(self.workers):
+                self._start_worker()
+        self.queue.put(work)
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._run, name='tweaks-loader', daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            work = self.queue.get()
+            if work is None or work():
+                return
+
+    def shutdown(self):
+        if self.queue is not None:
+            # Drop the values that weren't started, the workers exit after their current value
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            for i in range(self.workers):
+                self.queue.put(None)
@@ -0,0 +1,82 @@
+import time
+import threading
+
+# Counters for the reads and writes done by every backend, keyed on (backend, operation, path).
+# The "get" and "set" operations are the values read and written by the settings, "read" and
+# "write" are the actual file I/O. Many gets for a single read is fine, two writes of the same
+# file for one change is not.
+_lock = threading.Lock()
+_counters = {}
+
+
+class Timer:
+    __slots__ = ['backend', 'operation', 'path', 'start']
+
+    def __init__(self, backend, operation, path):
+        self.backend = backend
+        self.operation = operation
+        self.path = path
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.backend, self.operation, self.path, time.perf_counter() - self.start)
+
+
+def timed(backend, operation, path):
+    """ Count a block of code as one operation on path and add its duration to the total """
+    return Timer(backend, operation, path)
+
+
+def record(backend, operation, path, seconds):
+    key = (backend, operation, str(path))
+    with _lock:
+        counter = _counters.get(key)
+        if counter is None:
+            _counters[key] = [1, seconds]
+        else:
+            counter[0] += 1
+            counter[1] += seconds
+
+
+def snapshot():
+    """ Get the counters as a list of dicts, sorted by backend, operation and path """
+    with _lock:
+        items = sorted(_counters.items())
+    result = []
+    for (backend, operation, path), (count, seconds) in items:
+        result.append({
+            'backend': backend,
+            'operation': operation,
+            'path': path,
+            'count': count,
+            'seconds': seconds,
+        })
+    return result
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+def format_table(counters=None):
+    if counters is None:
+        counters = snapshot()
+    lines = [f"{'backend':<14} {'op':<6} {'count':>7} {'total ms':>10} {'avg ms':>8}  path"]
+    for counter in counters:
+        average = counter['seconds'] / counter['count'] * 1000
+        lines.append(f"{counter['backend']:<14} {counter['operation']:<6} {counter['count']:>7} "
+                     f"{counter['seconds'] * 1000:>10.2f} {average:>8.3f}  {counter['path']}")
+    return '\n'.join(lines)
+
+
+def dump(*args):
+    """ Write the counters to stderr, this is connected to SIGUSR1 """
+    import sys
+
+    sys.stderr.write(format_table() + '\n')
+    sys.stderr.flush()
+    return True
@@ -0,0 +1,56 @@
+from danctnix_tweaks.documents import Document, get_document
+
+OSK_CONF = '/boot/osk.conf'
+
+
+class OskConfig(Document):
+    """ The osk-sdl config file, a list of key = value lines
+
+    Comments and the order of the keys are preserved when the file is written.
+    """
+
+    kind = 'osksdl'
+
+    def parse(self, raw):
+        self.lines = []
+        self.index = {}
+        if raw is None:
+            self.lines = ['# Generated by danctnix-tweaks\n', '\n']
+        else:
+            self.lines = raw.splitlines(keepends=True)
+        for i, line in enumerate(self.lines):
+            if line.startswith('#') or '=' not in line:
+                continue
+            key = line.split('=', maxsplit=1)[0].strip()
+            self.index[key] = i
+
+    def serialize(self):
+        return ''.join(self.lines)
+
+    def get(self, key, default=None):
+        with self.lock:
+            self.refresh()
+            if key not in self.index:
+                return default
+            return self.lines[self.index[key]].split('=', maxsplit=1)[1].strip()
+
+    def set(self, key, value):
+        """ Change a key, returns False if it already had this value """
+        line = f'{key} = {value}\n'
+        with self.lock:
+            self.refresh()
+            if key in self.index:
+                if self.lines[self.index[key]] == line:
+                    return False
+                self.lines[self.index[key]] = line
+            else:
+                if len(self.lines) > 0 and not self.lines[-1].endswith('\n'):
+                    self.lines[-1] += '\n'
+                self.index[key] = len(self.lines)
+                self.lines.append(line)
+        self.changed()
+        return True
+
+
+def get_osk_config(path=None):
+    return get_document(OskConfig, path or OSK_CONF)
@@ -0,0 +1,99 @@
+import os
+import json
+import logging
+
+from danctnix_tweaks.backends.base import check_value
+from danctnix_tweaks.fileio import atomic_write
+
+log = logging.getLogger(__name__)
+
+# Profiles shipped by the distribution, a user profile with the same name takes precedence
+SYSTEM_PROFILES = '/etc/danctnix-tweaks/profiles'
+
+
+def user_profiles():
+    return os.path.join(os.path.expanduser(os.getenv('XDG_CONFIG_HOME', '~/.config')), 'danctnix-tweaks/profiles')
+
+
+def _check_name(name):
+    if name == '' or '/' in name or name.startswith('.'):
+        raise ValueError(f"Invalid profile name {name}")
+
+
+def list_profiles():
+    names = set()
+    for directory in [user_profiles(), SYSTEM_PROFILES]:
+        try:
+            entries = os.listdir(directory)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.endswith('.json') and not entry.startswith('.'):
+                names.add(entry[:-5])
+    return sorted(names)
+
+
+def load(name):
+    """ Get the values stored in a profile as a dict of setting path to value """
+    _check_name(name)
+    for directory in [user_profiles(), SYSTEM_PROFILES]:
+        path = os.path.join(directory, name + '.json')
+        if os.path.isfile(path):
+            with open(path) as handle:
+                values = json.load(handle)
+            if not isinstance(values, dict):
+                raise ValueError(f"Profile {name} doesn't contain a setting to value object")
+            return values
+    raise KeyError(name)
+
+
+def save(name, values):
+    _check_name(name)
+    atomic_write(os.path.join(user_profiles(), name + '.json'), json.dumps(values, indent=2) + '\n')
+
+
+def delete(name):
+    _check_name(name)
+    path = os.path.join(user_profiles(), name + '.json')
+    if not os.path.isfile(path):
+        raise KeyError(name)
+    os.unlink(path)
+
+
+def capture(tree, paths=None):
+    """ Get the current value of every changeable setting in the tree, or the ones under paths """
+    settings = [path for path, setting in tree.find(paths) if setting.type != 'info']
+    return tree.get_values(settings)
+
+
+def apply(tree, values, changes=None):
+    """ Change the settings to the values of a profile
+
+    Only the settings that have a different value are changed, all in a single batch. Settings
+    in the profile that don't exist on this device or have an invalid value are skipped. With
+    changes the values are staged in that ChangeSet like set_values() does. Returns a dict of
+    path to setting for the settings that were changed.
+    """
+    known = dict(tree.iter_settings())
+    checked = {}
+    for path, value in values.items():
+        if path not in known:
+            log.info("Skipping %s, not available", path)
+            continue
+        setting = known[path]
+        if setting.type == 'info':
+            continue
+        try:
+            value = check_value(setting, value)
+        except ValueError as e:
+            log.warning("Skipping %s, invalid value: %s", path, e)
+            continue
+        if setting.map and value not in setting.map:
+            log.warning("Skipping %s, expected one of: %s", path, ', '.join(setting.map))
+            continue
+        checked[path] = value
+
+    current = tree.get_values(list(checked))
+    changed = {path: value for path, value in checked.items() if current[path] != value}
+    tree.set_values(changed, changes)
+    return {path: known[path] for path in changed}
@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+
+import gi
+
+gi.require_version('Gtk', '3.0')
+from gi.repository import GLib
+
+log = logging.getLogger(__name__)
+
+# Reads that are due within this many milliseconds of each other are done in the same tick
+SLACK = 250
+
+
+class Entry:
+    __slots__ = ['setting', 'interval', 'due', 'fd', 'source']
+
+    def __init__(self, setting, interval):
+        self.setting = setting
+        self.interval = interval
+        self.due = 0
+        self.fd = None
+        self.source = None
+
+
+class RefreshScheduler:
+    """ Re-reads the info settings that have a refresh option while their page is visible
+
+    All periodic reads share a single timer that is set to the next time a read is due. Sysfs
+    attributes with "refresh: notify" are re-read when the kernel notifies a change, which is
+    done with poll() on the attribute instead of a timer.
+    """
+
+    def __init__(self, read):
+        # Called with a setting whenever its value should be read again
+        self.read = read
+        self.pages = {}
+        self.visible = None
+        self.timer = None
+
+    def add(self, setting):
+        refresh = setting.definition['refresh']
+        if refresh == 'notify':
+            if setting.backend != 'sysfs':
+                log.warning("Ignoring refresh: notify for %s, only sysfs supports it", setting.name)
+                return
+            entry = Entry(setting, None)
+        else:
+            entry = Entry(setting, int(refresh))
+        self.pages.setdefault(setting.page, []).append(entry)
+        if setting.page == self.visible:
+            self._start(entry)
+            self._schedule()
+
+    def set_visible_page(self, page):
+        """ Only the settings on the visible page are refreshed, None pauses all refreshes """
+        if page == self.visible:
+            return
+        for entry in self.pages.get(self.visible, []):
+            self._stop(entry)
+        self.visible = page
+        for entry in self.pages.get(page, []):
+            self._start(entry)
+        self._schedule()
+
+    def _start(self, entry):
+        if entry.interval is not None:
+            # The value was just read when the page was built, the first refresh is one interval later
+            entry.due = time.monotonic() * 1000 + entry.interval
+            return
+
+        try:
+            entry.fd = os.open(entry.setting.key, os.O_RDONLY)
+            # The attribute has to be read once before poll() reports changes
+            os.read(entry.fd, 4096)
+        except OSError as e:
+            log.warning("Can't watch %s: %s", entry.setting.key, e)
+            if entry.fd is not None:
+                os.close(entry.fd)
+                entry.fd = None
+            return
+        entry.source = GLib.unix_fd_add_full(GLib.PRIORITY_DEFAULT, entry.fd,
+                                             GLib.IOCondition.PRI | GLib.IOCondition.ERR,
+                                             self._on_notify, entry)
+        self.read(entry.setting)
+
+    def _stop(self, entry):
+        if entry.source is not None:
+            GLib.source_remove(entry.source)
+            entry.source = None
+        if entry.fd is not None:
+            os.close(entry.fd)
+            entry.fd = None
+
+    def _on_notify(self, fd, condition, entry):
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.read(fd, 4096)
+        except OSError:
+            pass
+        self.read(entry.setting)
+        return True
+
+    def _schedule(self):
+        if self.timer is not None:
+            GLib.source_remove(self.timer)
+            self.timer = None
+
+        due = [entry.due for entry in self.pages.get(self.visible, []) if entry.interval is not None]
+        if len(due) == 0:
+            return
+
+        delay = max(0, int(min(due) - time.monotonic() * 1000))
+        if delay >= 1000 and delay % 1000 < SLACK:
+            # Second granularity timers are woken up together with the other timers on the system
+            self.timer = GLib.timeout_add_seconds(delay // 1000, self._on_tick)
+        else:
+            self.timer = GLib.timeout_add(delay, self._on_tick)
+
+    def _on_tick(self):
+        self.timer = None
+        now = time.monotonic() * 1000
+        for entry in self.pages.get(self.visible, []):
+            if entry.interval is None or entry.due > now + SLACK:
+                continue
+            entry.due = now + entry.interval
+            self.read(entry.setting)
+        self._schedule()
+        return False
+
+    def close(self):
+        self.set_visible_page(None)
@@ -0,0 +1,123 @@
+import os
+import json
+import struct
+import socket
+import threading
+import subprocess
+import configparser
+import socketserver
+
+from danctnix_tweaks import metrics
+from danctnix_tweaks.fileio import atomic_write
+from danctnix_tweaks.tweakd import CONFIG, apply_config
+
+POLKIT_ACTION = 'org.danctnix.Tweaks.apply'
+
+# Seconds a client may take to send its request before the connection is dropped
+CLIENT_TIMEOUT = 5
+
+# Longest request in bytes that is accepted, a tweakd.conf is only a few KiB
+MAX_REQUEST = 64 * 1024
+
+# Connections that are handled at the same time, more clients wait until one of them is done
+MAX_CLIENTS = 8
+
+
+def is_authorized(pid, uid):
+    if uid == 0 or uid == os.getuid():
+        return True
+
+    # Ask polkit, the start time of the process is passed to prevent pid reuse races
+    try:
+        with open(f'/proc/{pid}/stat') as handle:
+            stat = handle.read()
+        start_time = stat.rsplit(')', maxsplit=1)[1].split()[19]
+        result = subprocess.run(['pkcheck', '--action-id', POLKIT_ACTION, '--process',
+                                 f'{pid},{start_time},{uid}', '--allow-user-interaction'],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, IndexError):
+        return False
+    return result.returncode == 0
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    # Applied to the connection in setup(), a client that doesn't send anything can't hold a thread
+    timeout = CLIENT_TIMEOUT
+
+    def handle(self):
+        creds = self.request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', creds)
+
+        try:
+            line = self.rfile.readline(MAX_REQUEST + 1)
+            if line == b'':
+                # The client went away without sending a request
+                return
+            if len(line) > MAX_REQUEST:
+                raise ValueError("Request too long")
+            message = json.loads(line.decode())
+        except socket.timeout:
+            return
+        except Exception as e:
+            response = {'status': 'error', 'message': str(e)}
+        else:
+            try:
+                response = self.server.handle_message(message, pid, uid)
+            except Exception as e:
+                response = {'status': 'error', 'message': str(e)}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class TweakdServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Handles every connection on its own thread, so a slow client or polkit prompt doesn't block the others """
+
+    daemon_threads = True
+
+    def __init__(self, path, whitelist, config_path=CONFIG):
+        self.whitelist = whitelist
+        self.config_path = config_path
+        # Only one request at a time writes tweakd.conf and applies it
+        self.lock = threading.Lock()
+        self.clients = threading.BoundedSemaphore(MAX_CLIENTS)
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, RequestHandler)
+
+        # Everyone may connect, requests are authorized with polkit
+        os.chmod(path, 0o666)
+
+    def process_request(self, request, client_address):
+        # Runs on the thread that accepts connections, so new clients stay in the listen backlog
+        # while all the handler threads are busy
+        self.clients.acquire()
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.clients.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.clients.release()
+
+    def handle_message(self, message, pid, uid):
+        # The counters only contain the paths from the setting definitions, anyone may read them
+        if message.get('action') == 'metrics':
+            return {'status': 'ok', 'metrics': metrics.snapshot()}
+        if message.get('action') != 'apply':
+            return {'status': 'error', 'message': 'Unknown action'}
+        if not is_authorized(pid, uid):
+            return {'status': 'error', 'message': 'Not authorized'}
+
+        config = configparser.ConfigParser()
+        config.read_string(message['config'])
+        with self.lock:
+            atomic_write(self.config_path, message['config'])
+            applied, errors = apply_config(config, self.whitelist)
+        response = {'status': 'ok', 'applied': [list(change) for change in applied]}
+        if errors:
+            response['status'] = 'error'
+            response['message'] = ', '.join(f'{key}: {message}' for backend, key, message in errors)
+        return response
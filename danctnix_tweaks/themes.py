@@ -0,0 +1,127 @@
+import os
+
+from danctnix_tweaks import cache
+from danctnix_tweaks.tracing import span
+
+# The directories to scan for every theme data source, system themes first
+ROOTS = {
+    'gtk3themes': ['/usr/share/themes', '~/.local/share/themes'],
+    'iconthemes': ['/usr/share/icons', '~/.local/share/icons'],
+    'soundthemes': ['/usr/share/sounds', '~/.local/share/sounds'],
+}
+
+# The sections in index.theme that contain the display name, in order of preference
+NAME_SECTIONS = {
+    'gtk3themes': ['Desktop Entry', 'X-GNOME-Metatheme'],
+    'iconthemes': ['Icon Theme'],
+    'soundthemes': ['Sound Theme'],
+}
+
+_catalogs = {}
+
+
+def gtk_version():
+    """ The version of the gtk-3.x theme directory for the loaded Gtk
+
+    Returns None without loading Gtk if it isn't used by the process, like in the CLI, then
+    themes for any 3.x version are accepted.
+    """
+    import sys
+
+    if 'gi.repository.Gtk' not in sys.modules:
+        return None
+    from gi.repository import Gtk
+    minor = Gtk.MINOR_VERSION
+    if minor % 2:
+        minor += 1
+    return f'3.{minor}'
+
+
+def read_theme_name(path, sections):
+    """ Read the Name key from an index.theme file
+
+    Only the header of the file is parsed, reading stops as soon as all the sections that can
+    contain the name have been passed. Icon theme index files can be thousands of lines long
+    while the name is on one of the first lines.
+    """
+    names = {}
+    pending = set(sections)
+    current = None
+    try:
+        with open(path, errors='replace') as handle:
+            for line in handle:
+                line = line.strip()
+                if line.startswith('['):
+                    pending.discard(current)
+                    if len(pending) == 0:
+                        break
+                    current = line[1:line.find(']')]
+                    continue
+                if current not in pending or '=' not in line:
+                    continue
+                key, value = line.split('=', maxsplit=1)
+                if key.strip().lower() == 'name' and current not in names:
+                    names[current] = value.strip()
+    except OSError:
+        return None
+
+    for section in sections:
+        if section in names:
+            return names[section]
+    return None
+
+
+def _is_theme(source, path, gtk_ver):
+    if source == 'gtk3themes':
+        if os.path.isfile(os.path.join(path, 'gtk-3.0/gtk.css')):
+            return True
+        if gtk_ver is None:
+            try:
+                return any(name.startswith('gtk-3.') for name in os.listdir(path))
+            except OSError:
+                return False
+        return os.path.isdir(os.path.join(path, f'gtk-{gtk_ver}'))
+    return os.path.isfile(os.path.join(path, 'index.theme'))
+
+
+def _scan(source, roots, gtk_ver):
+    themes = []
+    for root in roots:
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            continue
+        for entry in entries:
+            if not entry.is_dir() or not _is_theme(source, entry.path, gtk_ver):
+                continue
+            name = read_theme_name(os.path.join(entry.path, 'index.theme'), NAME_SECTIONS[source])
+            themes.append((entry.path, name or entry.name, entry.name))
+
+    themes.sort()
+    return [(name, theme) for path, name, theme in themes]
+
+
+def catalog(source, gtk_ver=None):
+    """ Get the installed themes for a data source as a list of (display name, theme) tuples
+
+    The result is cached on the mtime of the root directories, so an unchanged set of themes costs
+    one stat per root. Changing a theme in place without adding or removing one isn't noticed.
+    """
+    roots = [os.path.expanduser(root) for root in ROOTS[source]]
+    key = [source, gtk_ver]
+    for root in roots:
+        try:
+            key.append((root, os.stat(root).st_mtime_ns))
+        except OSError:
+            key.append((root, None))
+
+    if source in _catalogs and _catalogs[source][0] == key:
+        return _catalogs[source][1]
+
+    themes = cache.load(f'themes-{source}', key)
+    if themes is None:
+        with span('theme scan', source=source):
+            themes = _scan(source, roots, gtk_ver)
+        cache.store(f'themes-{source}', key, themes)
+    _catalogs[source] = (key, themes)
+    return themes
@@ -0,0 +1,67 @@
+import os
+import time
+import atexit
+import threading
+
+# Set DANCTNIX_TWEAKS_TRACE to a filename to record the startup phases as Chrome trace events,
+# the result can be loaded in chrome://tracing or https://ui.perfetto.dev
+TRACE_FILE = os.getenv('DANCTNIX_TWEAKS_TRACE')
+
+_events = []
+
+
+class Span:
+    __slots__ = ['name', 'category', 'args', 'start']
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        _events.append({
+            'name': self.name,
+            'cat': self.category,
+            'ph': 'X',
+            'ts': self.start / 1000,
+            'dur': (end - self.start) / 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': self.args,
+        })
+
+
+class NullSpan:
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_null = NullSpan()
+
+
+def span(name, category='tweaks', **args):
+    """ Time a block of code as a trace span, does nothing unless tracing is enabled """
+    if TRACE_FILE is None:
+        return _null
+    return Span(name, category, args)
+
+
+def write():
+    import json
+
+    with open(TRACE_FILE, 'w') as handle:
+        json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, handle)
+
+
+if TRACE_FILE is not None:
+    atexit.register(write)
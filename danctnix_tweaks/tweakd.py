@@ -1,11 +1,21 @@
 import os
+import time
+import logging
+import argparse
 import configparser
-from collections import OrderedDict
 
+from danctnix_tweaks import documents
+from danctnix_tweaks import metrics
+from danctnix_tweaks import ipc
+from danctnix_tweaks.oskconf import get_osk_config
 from danctnix_tweaks.settingstree import SettingsTree
 
+CONFIG = '/etc/danctnix-tweaks/tweakd.conf'
 
-def main(version, datadir=None):
+log = logging.getLogger(__name__)
+
+
+def load_whitelist(datadir):
     # Read settings yaml files to build a whitelist of settings that are allowed to change
     # The daemon parameter makes it not load gtk components and skip gsettings things that won't
     # work as root
@@ -13,53 +23,135 @@ def main(version, datadir=None):
     if datadir is not None:
         st.load_dir(os.path.join(datadir, 'danctnix-tweaks'))
     st.load_dir('/etc/danctnix-tweaks')
-    settings = st.settings
 
-    whitelist_sysfs = []
+    whitelist = {
+        'sysfs': set(),
+        'osksdl': set(),
+    }
 
-    for page in settings:
-        for section in settings[page]['sections']:
-            for setting in settings[page]['sections'][section]['settings']:
-                s = settings[page]['sections'][section]['settings'][setting]
-                if s.backend == 'sysfs':
-                    whitelist_sysfs.append(s.key)
+    for backend in whitelist:
+        whitelist[backend] = {setting.key for setting in st.by_backend(backend)}
+    return whitelist
 
-    # Read the stored settings and apply them
-    config = configparser.ConfigParser()
-    config.read('/etc/danctnix-tweaks/tweakd.conf')
+
+def read_sysfs(path):
+    try:
+        with metrics.timed('sysfs', 'read', path):
+            with open(path) as handle:
+                return handle.read().rstrip('\0').strip()
+    except OSError:
+        return None
+
+
+def apply_config(config, whitelist, dry_run=False):
+    """ Apply the stored settings, only the values that differ from the current state are written
+
+    Returns a list of (backend, key, value, seconds) tuples for the changed values and a list of
+    (backend, key, message) tuples for the writes that failed. The osk-sdl values are written to
+    osk.conf together, so their seconds are None and a failed write is reported once for the file.
+    """
+    applied = []
+    errors = []
 
     # Apply sysfs settings
     if config.has_section('sysfs'):
         for path in config.options('sysfs'):
-            if path not in whitelist_sysfs:
-                print(f"Skipping {path}, not defined in setting definitions")
+            if path not in whitelist['sysfs']:
+                log.warning("Skipping %s, not defined in setting definitions", path)
+                continue
             value = config.get('sysfs', path)
-            print(f"{path} = {value}")
-            with open(path, 'w') as handle:
-                handle.write(value)
+            current = read_sysfs(path)
+            if current == value:
+                continue
+            if dry_run:
+                log.info("Would write %s = %s (currently %s)", path, value, current)
+                continue
 
-    # Apply osk-sdl settings
+            start = time.perf_counter()
+            try:
+                with open(path, 'w') as handle:
+                    handle.write(value)
+            except OSError as e:
+                log.error("Could not write %s: %s", path, e)
+                errors.append(('sysfs', path, str(e)))
+                continue
+            duration = time.perf_counter() - start
+            metrics.record('sysfs', 'write', path, duration)
+            log.info("%s = %s (%.1f ms)", path, value, duration * 1000)
+            applied.append(('sysfs', path, value, duration))
+
+    # Apply osk-sdl settings, the file is only written if one of the values changed
     if config.has_section('osksdl'):
-        oskconfig = OrderedDict()
-        if os.path.isfile('/boot/osk.conf'):
-            with(open('/boot/osk.conf')) as handle:
-                for line in handle.readlines():
-                    if line.startswith('#'):
+        oskconfig = get_osk_config()
+        changed = []
+        start = time.perf_counter()
+        try:
+            with documents.batch(), documents.reading():
+                for key in config.options('osksdl'):
+                    if key not in whitelist['osksdl']:
+                        log.warning("Skipping osk-sdl %s, not defined in setting definitions", key)
+                        continue
+                    value = config.get('osksdl', key).lower()
+                    current = oskconfig.get(key)
+                    if current == value:
                         continue
-                    if ' = ' not in line:
+                    if dry_run:
+                        log.info("Would set osk-sdl %s = %s (currently %s)", key, value, current)
                         continue
-                    key, val = line.split(' = ')
-                    oskconfig[key] = val.strip()
+                    oskconfig.set(key, value)
+                    changed.append((key, value))
+        except OSError as e:
+            # None of the values were stored, they are compared against the file again next time
+            log.error("Could not write %s: %s", oskconfig.path, e)
+            oskconfig.discard()
+            errors.append(('osksdl', oskconfig.path, str(e)))
+            changed = []
+        for key, value in changed:
+            log.info("osk-sdl %s = %s", key, value)
+            applied.append(('osksdl', key, value, None))
+        if changed:
+            log.info("Wrote %s (%.1f ms)", oskconfig.path, (time.perf_counter() - start) * 1000)
+
+    return applied, errors
+
+
+def main(version, datadir=None):
+    parser = argparse.ArgumentParser(description="DanctNIX Tweaks daemon")
+    parser.add_argument('--resident', action='store_true',
+                        help="Keep running and accept apply requests on a unix socket")
+    parser.add_argument('--socket', default=ipc.SOCKET, help="Path of the unix socket for --resident")
+    parser.add_argument('--config', default=CONFIG, help="Path of the stored settings")
+    parser.add_argument('--dry-run', action='store_true', help="Only print the changes that would be made")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Print the read and write counters of every backend before exiting")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show debug messages")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(message)s')
+
+    whitelist = load_whitelist(datadir)
+
+    # Read the stored settings and apply them
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    applied, errors = apply_config(config, whitelist, dry_run=args.dry_run)
+
+    if args.resident and not args.dry_run:
+        # The socket server is only imported when running as a resident daemon
+        from danctnix_tweaks.server import TweakdServer
 
-        for key in config.options('osksdl'):
-            oskconfig[key] = config.get('osksdl', key).lower()
+        # The counters of a running daemon can be dumped with SIGUSR1 or the metrics request
+        import signal
+        signal.signal(signal.SIGUSR1, metrics.dump)
 
-        result = '# Generated by danctnix-tweaks\n\n'
-        for key in oskconfig:
-            result += f"{key} = {oskconfig[key]}\n"
+        with TweakdServer(args.socket, whitelist, args.config) as server:
+            log.info("Listening on %s", args.socket)
+            server.serve_forever()
+    elif args.metrics:
+        metrics.dump()
 
-        with open('/boot/osk.conf', 'w') as handle:
-            handle.write(result)
+    if errors and not args.resident:
+        return 1
 
 
 if __name__ == '__main__':
@@ -0,0 +1,78 @@
+import os
+
+import gi
+
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gio, GLib
+
+
+class FileWatcher:
+    """ Watches files for changes made by other programs
+
+    The parent directory of every file is monitored so files that are replaced by a rename, like
+    the atomic writes done here, are still noticed. All events for a file that arrive within
+    the delay are coalesced into a single callback.
+    """
+
+    def __init__(self, delay=100):
+        self.delay = delay
+        self.monitors = {}
+        self.listeners = {}
+        self.pending = set()
+        self.timer = None
+
+    def watch(self, path, callback, prefix=False):
+        """ Call callback(path) when path changes, with prefix all files starting with "path." match """
+        path = os.path.abspath(os.path.expanduser(path))
+        directory, name = os.path.split(path)
+        if directory not in self.monitors:
+            try:
+                monitor = Gio.File.new_for_path(directory).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            except GLib.Error:
+                return
+            monitor.connect('changed', self._on_changed)
+            self.monitors[directory] = monitor
+            self.listeners[directory] = []
+        self.listeners[directory].append((name, prefix, callback))
+
+    def _on_changed(self, monitor, file, other_file, event_type):
+        if event_type in [Gio.FileMonitorEvent.ATTRIBUTE_CHANGED, Gio.FileMonitorEvent.PRE_UNMOUNT,
+                          Gio.FileMonitorEvent.UNMOUNTED]:
+            return
+        for changed in [file, other_file]:
+            if changed is None:
+                continue
+            path = changed.get_path()
+            if path is not None:
+                self.pending.add(path)
+
+        if self.timer is None:
+            self.timer = GLib.timeout_add(self.delay, self._flush)
+
+    def _flush(self):
+        self.timer = None
+        pending = self.pending
+        self.pending = set()
+
+        notified = set()
+        for path in pending:
+            directory, name = os.path.split(path)
+            for listener in self.listeners.get(directory, []):
+                watched, prefix, callback = listener
+                if name != watched and not (prefix and name.startswith(watched + '.')):
+                    continue
+                # A listener is notified once even if multiple of its files changed
+                if id(listener) in notified:
+                    continue
+                notified.add(id(listener))
+                callback(path)
+        return False
+
+    def close(self):
+        if self.timer is not None:
+            GLib.source_remove(self.timer)
+            self.timer = None
+        for monitor in self.monitors.values():
+            monitor.cancel()
+        self.monitors.clear()
+        self.listeners.clear()
@@ -1,11 +1,17 @@
-import os
-import subprocess
-import tempfile
-import time
+import io
+import signal
+import logging
 
 import gi
 
-from danctnix_tweaks.settingstree import SettingsTree
+from danctnix_tweaks import documents
+from danctnix_tweaks import metrics
+from danctnix_tweaks.gsettings import apply_delayed
+from danctnix_tweaks.settingstree import SettingsTree, definition_dirs
+from danctnix_tweaks.loader import ValueLoader, UNAVAILABLE
+from danctnix_tweaks.refresh import RefreshScheduler
+from danctnix_tweaks.tracing import span
+from danctnix_tweaks.watcher import FileWatcher
 
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, GObject, Gio, Gdk, GLib, Pango
@@ -13,10 +19,30 @@ from gi.repository import Gtk, GLib, GObject, Gio, Gdk, GLib, Pango
 gi.require_version('Handy', '1')
 from gi.repository import Handy
 
+log = logging.getLogger(__name__)
+
+
+class TweaksApplication(Gtk.Application):
+    def __init__(self, application_id, flags, datadir, staged=False):
+        self.datadir = datadir
+        self.staged = staged
+        Gtk.Application.__init__(self, application_id=application_id, flags=flags)
+        self.connect("activate", self.new_window)
+
+    def new_window(self, *args):
+        TweaksWindow(self, self.datadir, staged=self.staged)
+
+
+def run(datadir, staged=False):
+    Handy.init()
+    app = TweaksApplication("org.danctnix.Tweaks", Gio.ApplicationFlags.FLAGS_NONE, datadir, staged=staged)
+    app.run()
+
 
 class TweaksWindow:
-    def __init__(self, application, datadir):
+    def __init__(self, application, datadir, staged=False):
         self.application = application
+        self.staged = staged
 
         Handy.init()
 
@@ -28,15 +54,26 @@ class TweaksWindow:
         self.listbox = None
         self.stack = None
         self.back = None
+        self.pages = set()
+        self.updating = False
+        self.loader = ValueLoader()
+        self.refresher = RefreshScheduler(self.on_refresh)
+
+        # Coalesce the writes to config files from widget changes in the same main loop iteration
+        documents.set_flush_scheduler(GLib.idle_add)
+
+        # Dump the read and write counters of every backend with SIGUSR1
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, metrics.dump)
 
         self.create_window()
 
-        self.settings = SettingsTree()
-        if datadir:
-            self.settings.load_dir(os.path.join(datadir, 'danctnix-tweaks'))
-        self.settings.load_dir('/etc/danctnix-tweaks')
-        self.settings.load_dir('settings')
-        self.settings.load_dir('../settings')
+        self.settings = SettingsTree(staged=staged)
+        for path in definition_dirs(datadir):
+            self.settings.load_dir(path)
+
+        # Update the widgets when another program changes the files the settings are stored in
+        self.watcher = FileWatcher()
+        self.settings.watch(self.watcher)
 
         self.create_pages()
         self.window.show_all()
@@ -61,6 +98,14 @@ class TweaksWindow:
         self.back.set_no_show_all(True)
         self.headerbar.pack_start(self.back)
 
+        # Switching to a profile changes all its settings in one go, the list is filled when opened
+        self.profiles_menu = Gtk.Menu()
+        profiles = Gtk.MenuButton()
+        profiles.set_image(Gtk.Image.new_from_icon_name("view-more-symbolic", Gtk.IconSize.BUTTON))
+        profiles.set_popup(self.profiles_menu)
+        profiles.connect('toggled', self.on_profiles_toggled)
+        self.headerbar.pack_end(profiles)
+
         self.leaflet = Handy.Leaflet()
         self.leaflet.set_transition_type(Handy.LeafletTransitionType.SLIDE)
         self.leaflet.connect("notify::folded", self.on_leaflet_change)
@@ -83,6 +128,7 @@ class TweaksWindow:
         sw.add(self.listbox)
 
         self.stack = Gtk.Stack()
+        self.stack.connect('notify::visible-child-name', self.on_visible_page_change)
         self.content.pack_start(self.stack, True, True, 0)
 
         box.pack_start(self.headerbar, False, True, 0)
@@ -92,13 +138,20 @@ class TweaksWindow:
         self.action_revealer = Gtk.Revealer()
         box.pack_start(self.action_revealer, False, True, 0)
         self.action_revealer.add(self.actionbar)
-        label = Gtk.Label(label="You have changed settings that need root permissions to save.", xalign=0.0)
+        if self.staged:
+            label = Gtk.Label(label="You have unsaved changes.", xalign=0.0)
+        else:
+            label = Gtk.Label(label="You have changed settings that need root permissions to save.", xalign=0.0)
         label.set_line_wrap(True)
         self.actionbar.pack_start(label)
         self.action_button = Gtk.Button.new_with_label("Apply")
         self.action_button.get_style_context().add_class('suggested-action')
         self.actionbar.pack_end(self.action_button)
         self.action_button.connect('clicked', self.on_save_settings)
+        if self.staged:
+            revert = Gtk.Button.new_with_label("Revert")
+            self.actionbar.pack_end(revert)
+            revert.connect('clicked', self.on_revert_settings)
 
     def create_pages(self):
 
@@ -117,8 +170,21 @@ class TweaksWindow:
             self.listbox.add(row)
 
         self.listbox.set_selection_mode(Gtk.SelectionMode.NONE)
+        self.leaflet.set_visible_child_name('sidebar')
 
-        for page in self.settings.settings:
+        # The stack shows the first page when the leaflet is unfolded, build it once the window
+        # has been drawn
+        if len(self.settings.settings) > 0:
+            GLib.idle_add(self.create_page, next(iter(self.settings.settings)))
+
+    def create_page(self, page):
+        # Pages are only built the first time they are shown, this keeps the startup fast since
+        # creating the widgets also reads the current value of every setting on the page
+        if page in self.pages:
+            return False
+
+        # The files the settings on the page are stored in are only checked for changes once
+        with span('create_page', page=page), documents.reading():
             box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
             box.set_margin_top(12)
             box.set_margin_bottom(12)
@@ -129,8 +195,8 @@ class TweaksWindow:
             sw.add(box)
             self.stack.add_named(sw, page)
 
-            for section in self.settings.settings[page]['sections']:
-                label = Gtk.Label(label=section, xalign=0.0)
+            for section in self.settings.settings[page].sections.values():
+                label = Gtk.Label(label=section.name, xalign=0.0)
                 label.get_style_context().add_class('heading')
                 label.set_margin_bottom(4)
                 box.pack_start(label, False, True, 0)
@@ -141,8 +207,7 @@ class TweaksWindow:
                 fbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
                 frame.add(fbox)
 
-                for name in self.settings.settings[page]['sections'][section]['settings']:
-                    setting = self.settings.settings[page]['sections'][section]['settings'][name]
+                for name, setting in section.settings.items():
                     sbox = Gtk.Box()
                     sbox.set_margin_top(8)
                     sbox.set_margin_bottom(8)
@@ -163,107 +228,122 @@ class TweaksWindow:
                         hlabel.set_line_wrap(True)
                         lbox.pack_start(hlabel, False, True, 0)
 
-                    if setting.type == 'boolean':
-                        widget = Gtk.Switch()
-                        widget.set_active(setting.get_value())
-
-                        # Make sure I leak some memory
-                        setting.widget = widget
-                        widget.setting = setting
-
-                        widget.connect('notify::active', self.on_widget_changed)
-
-                        setting.connect(self.on_setting_change)
-                        wbox.pack_start(widget, False, False, 0)
-                    elif setting.type == 'info':
-                        widget = Gtk.Label(label=setting.get_value())
-                        widget.set_xalign(0.0)
-                        widget.get_style_context().add_class('dim-label')
-                        widget.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
-                        wbox.pack_start(widget, False, False, 0)
-                    elif setting.type == 'choice':
-                        widget = Gtk.ComboBoxText()
-                        setting.widget = widget
-                        widget.setting = setting
-
-                        widget.set_entry_text_column(0)
-                        val = setting.get_value()
-                        i = 0
-                        for key in setting.map:
-                            widget.append_text(key)
-                            if key == val:
-                                widget.set_active(i)
-                            i += 1
-                        widget.connect('changed', self.on_widget_changed)
-                        setting.connect(self.on_setting_change)
-                        wbox.pack_start(widget, False, False, 0)
-                    elif setting.type == 'font':
-                        widget = Gtk.FontButton()
-                        setting.widget = widget
-                        widget.setting = setting
-                        widget.set_font(setting.get_value())
-                        widget.connect('font-set', self.on_widget_changed)
-                        setting.connect(self.on_setting_change)
-                        wbox.pack_start(widget, False, False, 0)
-                    elif setting.type == 'file':
-                        widget = Gtk.FileChooserButton()
-                        setting.widget = widget
-                        widget.setting = setting
-                        temp = setting.get_value()
-                        if temp is None:
-                            temp = '~'
-                        widget.set_filename(temp)
-                        widget.connect('file-set', self.on_widget_changed)
-                        setting.connect(self.on_setting_change)
-                        enable = Gtk.Switch()
-                        if temp != '~':
-                            enable.set_active(True)
-                        enable.setting = setting
-                        enable.set_margin_bottom(5)
-                        enable.connect('notify::active', self.on_widget_changed)
-                        widget.null_switch = enable
-                        enable.target = widget
-                        switchbox = Gtk.Box()
-                        switchbox.add(enable)
-                        wbox.add(switchbox)
-                        wbox.add(widget)
-                    elif setting.type == 'color':
-                        widget = Gtk.ColorButton()
-                        setting.widget = widget
-                        widget.setting = setting
-                        value = setting.get_value()
-                        if value.startswith('#'):
-                            color = Gdk.color_parse(value)
-                            widget.set_color(color)
-                        widget.connect('color-set', self.on_widget_changed)
-                        setting.connect(self.on_setting_change)
-                        wbox.pack_start(widget, False, False, 0)
-                    elif setting.type == 'number':
-                        value = setting.get_value()
-                        if 'percentage' in setting.definition and setting.definition['percentage']:
-                            w_min = 0
-                            w_max = 100
-                            w_step = 1
-                            val_range = setting.definition['max'] - setting.definition['min']
-                            value = int((value - setting.definition['min']) / val_range * 100)
-
-                        else:
-                            w_min = setting.definition['min']
-                            w_max = setting.definition['max']
-                            w_step = setting.definition['step']
-                        widget = Gtk.SpinButton.new_with_range(w_min, w_max, w_step)
-                        setting.widget = widget
-                        widget.setting = setting
-                        widget.set_value(float(value))
-                        widget.connect('value-changed', self.on_widget_changed)
-                        setting.connect(self.on_setting_change)
-                        wbox.pack_start(widget, False, False, 0)
+                    with span('create_widget', setting=name, type=setting.type):
+                        self.create_widget(setting, wbox)
 
-        self.leaflet.set_visible_child_name('sidebar')
+                    # The widget is created without a value and is filled in when the value has been
+                    # read, which might happen on a worker thread for slow backends
+                    wbox.set_sensitive(False)
+                    self.loader.load(setting, self.on_value_loaded)
+
+                    if setting.type == 'info' and 'refresh' in setting.definition:
+                        self.refresher.add(setting)
+
+            sw.show_all()
+        self.pages.add(page)
+        return False
+
+    def create_widget(self, setting, wbox):
+        if setting.type == 'boolean':
+            widget = Gtk.Switch()
+
+            # Make sure I leak some memory
+            setting.widget = widget
+            widget.setting = setting
+
+            widget.connect('notify::active', self.on_widget_changed)
+
+            setting.connect(self.on_setting_change)
+            wbox.pack_start(widget, False, False, 0)
+        elif setting.type == 'info':
+            widget = Gtk.Label(label='Loading…')
+            setting.widget = widget
+            widget.set_xalign(0.0)
+            widget.get_style_context().add_class('dim-label')
+            widget.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+            wbox.pack_start(widget, False, False, 0)
+        elif setting.type == 'choice':
+            widget = Gtk.ComboBoxText()
+            setting.widget = widget
+            widget.setting = setting
+
+            widget.set_entry_text_column(0)
+            for key in setting.map:
+                widget.append_text(key)
+            widget.connect('changed', self.on_widget_changed)
+            setting.connect(self.on_setting_change)
+            wbox.pack_start(widget, False, False, 0)
+        elif setting.type == 'font':
+            widget = Gtk.FontButton()
+            setting.widget = widget
+            widget.setting = setting
+            widget.connect('font-set', self.on_widget_changed)
+            setting.connect(self.on_setting_change)
+            wbox.pack_start(widget, False, False, 0)
+        elif setting.type == 'file':
+            widget = Gtk.FileChooserButton()
+            setting.widget = widget
+            widget.setting = setting
+            widget.connect('file-set', self.on_widget_changed)
+            setting.connect(self.on_setting_change)
+            enable = Gtk.Switch()
+            enable.setting = setting
+            enable.set_margin_bottom(5)
+            enable.connect('notify::active', self.on_widget_changed)
+            widget.null_switch = enable
+            enable.target = widget
+            switchbox = Gtk.Box()
+            switchbox.add(enable)
+            wbox.add(switchbox)
+            wbox.add(widget)
+        elif setting.type == 'color':
+            widget = Gtk.ColorButton()
+            setting.widget = widget
+            widget.setting = setting
+            widget.connect('color-set', self.on_widget_changed)
+            setting.connect(self.on_setting_change)
+            wbox.pack_start(widget, False, False, 0)
+        elif setting.type == 'number':
+            if 'percentage' in setting.definition and setting.definition['percentage']:
+                w_min = 0
+                w_max = 100
+                w_step = 1
+            else:
+                w_min = setting.definition['min']
+                w_max = setting.definition['max']
+                w_step = setting.definition['step']
+            widget = Gtk.SpinButton.new_with_range(w_min, w_max, w_step)
+            setting.widget = widget
+            widget.setting = setting
+            widget.connect('value-changed', self.on_widget_changed)
+            setting.connect(self.on_setting_change)
+            wbox.pack_start(widget, False, False, 0)
+
+    def on_value_loaded(self, setting, value):
+        if value is UNAVAILABLE:
+            if setting.type == 'info':
+                setting.widget.set_label('N/A')
+            return
+        self.on_setting_change(setting, value)
+        setting.widget.get_parent().set_sensitive(True)
 
     def on_setting_change(self, setting, value):
+        # Keep showing the staged value until the changes are applied or reverted
+        if self.settings.changes is not None and setting in self.settings.changes:
+            return
+
+        # Changing the widget state emits the widget signals, don't write the value back
+        self.updating = True
+        try:
+            self.update_widget(setting, value)
+        finally:
+            self.updating = False
+
+    def update_widget(self, setting, value):
         if setting.type == 'boolean':
             setting.widget.set_active(value)
+        elif setting.type == 'info':
+            setting.widget.set_label(str(value))
         elif setting.type == 'choice':
             i = 0
             for key in setting.map:
@@ -273,36 +353,42 @@ class TweaksWindow:
         elif setting.type == 'font':
             setting.widget.set_font(value)
         elif setting.type == 'file':
+            setting.widget.null_switch.set_active(value is not None)
             if value is None:
                 value = '~'
             setting.widget.set_filename(value)
+        elif setting.type == 'color':
+            if value is not None and value.startswith('#'):
+                setting.widget.set_color(Gdk.color_parse(value))
         elif setting.type == 'number':
             if 'percentage' in setting.definition and setting.definition['percentage']:
                 val_range = setting.definition['max'] - setting.definition['min']
                 value = int((value - setting.definition['min']) / val_range * 100)
-            setting.widget.set_value(value)
+            setting.widget.set_value(float(value))
 
     def on_widget_changed(self, widget, *args):
+        if self.updating:
+            return
         setting = widget.setting
-        if setting.needs_root:
+        if setting.needs_root or self.staged:
             self.action_revealer.set_reveal_child(True)
         if setting.type == 'boolean':
-            setting.set_value(widget.get_active())
+            self.settings.set_value(setting, widget.get_active())
         elif setting.type == 'choice':
-            setting.set_value(widget.get_active_text())
+            self.settings.set_value(setting, widget.get_active_text())
         elif setting.type == 'font':
-            setting.set_value(widget.get_font())
+            self.settings.set_value(setting, widget.get_font())
         elif setting.type == 'file':
             if hasattr(widget, 'null_switch'):
                 # Filechooser changed
-                setting.set_value(widget.get_filename())
+                self.settings.set_value(setting, widget.get_filename())
                 widget.null_switch.set_active(True)
             else:
                 # Null switch changed
                 if widget.get_active():
                     return
                 else:
-                    setting.set_value(None)
+                    self.settings.set_value(setting, None)
                     widget.target.set_filename("~")
 
         elif setting.type == 'number':
@@ -310,16 +396,17 @@ class TweaksWindow:
             if 'percentage' in setting.definition and setting.definition['percentage']:
                 val_range = setting.definition['max'] - setting.definition['min']
                 value = (value / 100 * val_range) + setting.definition['min']
-            setting.set_value(value)
+            self.settings.set_value(setting, value)
         elif setting.type == 'color':
             value = widget.get_color().to_string()
             value = '#' + value[1:3] + value[5:7] + value[9:11]
-            setting.set_value(value)
+            self.settings.set_value(setting, value)
 
     def on_select_page(self, widget, row):
         if self.listbox.get_selection_mode() == Gtk.SelectionMode.NONE:
             self.listbox.set_selection_mode(Gtk.SelectionMode.SINGLE)
             self.listbox.select_row(row)
+        self.create_page(row.name)
         self.stack.set_visible_child_name(row.name)
         self.headerbar.set_subtitle(row.title)
         self.leaflet.set_visible_child_name('content')
@@ -330,6 +417,11 @@ class TweaksWindow:
             self.listbox.unselect_row(row)
 
     def on_main_window_destroy(self, widget):
+        self.loader.shutdown()
+        self.refresher.close()
+        self.watcher.close()
+        apply_delayed()
+        documents.flush()
         Gtk.main_quit()
 
     def on_back_clicked(self, widget, *args):
@@ -340,12 +432,118 @@ class TweaksWindow:
         folded = self.leaflet.get_folded()
         content = self.leaflet.get_visible_child_name() == "content"
         self.back.set_visible(folded and content)
+        self.on_visible_page_change()
+
+    def on_visible_page_change(self, *args):
+        if self.stack is None:
+            return
+
+        # In the folded view the page isn't visible while the sidebar is shown
+        page = self.stack.get_visible_child_name()
+        if self.leaflet.get_folded() and self.leaflet.get_visible_child_name() != 'content':
+            page = None
+        self.refresher.set_visible_page(page)
+
+    def on_refresh(self, setting):
+        if setting.widget is not None:
+            self.loader.load(setting, self.on_value_loaded)
 
     def on_save_settings(self, *args):
-        fd, filename = tempfile.mkstemp()
-        with open(filename, 'w') as handle:
-            self.settings.save_tweakd_config(handle)
+        needs_root = True
+        if self.staged:
+            needs_root = self.settings.changes.needs_root
+            try:
+                self.settings.commit()
+            except Exception as e:
+                # The changes stay staged so they can be applied again or reverted
+                self.show_error("Could not apply the changes", str(e))
+                return
+
+        if needs_root:
+            self.apply_root_settings()
 
-        subprocess.run(['pkexec', 'pk-tweaks-action', filename])
+        self.action_revealer.set_reveal_child(False)
 
+    def apply_root_settings(self):
+        from danctnix_tweaks import ipc
+
+        config = io.StringIO()
+        self.settings.save_tweakd_config(config)
+        error = ipc.apply(config.getvalue())
+        if error is not None:
+            self.show_error("Could not apply the system settings", error)
+
+    def show_error(self, title, message):
+        log.error("%s: %s", title, message)
+        dialog = Gtk.MessageDialog(transient_for=self.window, modal=True, message_type=Gtk.MessageType.ERROR,
+                                   buttons=Gtk.ButtonsType.CLOSE, text=title)
+        dialog.format_secondary_text(message)
+        dialog.connect('response', lambda dialog, response: dialog.destroy())
+        dialog.show()
+
+    def on_profiles_toggled(self, button):
+        if not button.get_active():
+            return
+
+        from danctnix_tweaks.profiles import list_profiles
+
+        for item in self.profiles_menu.get_children():
+            self.profiles_menu.remove(item)
+        names = list_profiles()
+        if len(names) == 0:
+            item = Gtk.MenuItem(label="No profiles")
+            item.set_sensitive(False)
+            self.profiles_menu.append(item)
+        for name in names:
+            item = Gtk.MenuItem(label=name)
+            item.connect('activate', self.on_apply_profile, name)
+            self.profiles_menu.append(item)
+        self.profiles_menu.show_all()
+
+    def on_apply_profile(self, item, name):
+        from danctnix_tweaks import profiles
+        from danctnix_tweaks.changeset import ChangeSet
+
+        try:
+            values = profiles.load(name)
+        except KeyError:
+            self.show_error(f"Could not load the {name} profile", "The profile doesn't exist")
+            return
+        except (OSError, ValueError) as e:
+            self.show_error(f"Could not load the {name} profile", str(e))
+            return
+
+        # The profile replaces the staged changes of its settings, other staged changes stay staged
+        dropped = []
+        if self.staged:
+            for path, setting in self.settings.iter_settings():
+                if path in values and self.settings.changes.discard(setting):
+                    dropped.append(setting)
+            if len(self.settings.changes) == 0:
+                self.action_revealer.set_reveal_child(False)
+
+        # Profiles are applied right away, also in staged mode
+        changes = ChangeSet()
+        changed = {}
+        try:
+            changed = profiles.apply(self.settings, values, changes)
+            needs_root = changes.needs_root
+            changes.commit()
+        except Exception as e:
+            # The commit restores the values it already wrote, the widgets are updated below
+            self.show_error(f"Could not apply the {name} profile", str(e))
+            needs_root = False
+        if needs_root:
+            self.apply_root_settings()
+            if not self.staged:
+                self.action_revealer.set_reveal_child(False)
+
+        for setting in dropped + list(changed.values()):
+            if setting.widget is not None:
+                self.on_setting_change(setting, setting.get_value())
+
+    def on_revert_settings(self, *args):
+        for setting in self.settings.rollback():
+            if setting.widget is not None:
+                self.on_setting_change(setting, setting.get_value())
         self.action_revealer.set_reveal_child(False)